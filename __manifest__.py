@@ -1,6 +1,6 @@
 {
     'name': 'Customer Credit Limit',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.2.0',
     'category': 'Sales',
     'summary': 'Credit limit management for customers with Fertilizer and SND categories',
     'description': """
@@ -16,11 +16,14 @@
         # 'security/security_groups.xml',
         'security/res_groups.xml',
         'security/ir.model.access.csv',
+        'data/credit_exposure_data.xml',
+        'data/ir_cron_data.xml',
         'views/account_payment_views.xml',
         'views/product_category_views.xml',
         'views/res_partner_views.xml',
         'views/sale_order_views.xml',
         'views/res_users_views.xml',
+        'wizard/credit_limit_import_views.xml',
     ],
     'installable': True,
     'application': False,
@@ -0,0 +1,22 @@
+from odoo import http
+from odoo.http import request
+
+
+class CustomerCreditController(http.Controller):
+
+    @http.route('/customer_credit/check_exposure', type='json', auth='user', methods=['POST'])
+    def check_exposure(self, partner_id=None, category_id=None, amount=0.0, business_unit_id=None, checks=None):
+        """Credit check for order channels.
+
+        Send either one check (partner_id, category_id, amount, business_unit_id)
+        or a list of them as checks; the answer has the same shape. Sales
+        users only, malformed checks are answered with an error.
+        """
+        if checks is None:
+            return request.env['res.partner.credit.exposure'].check_exposure([{
+                'partner_id': partner_id,
+                'category_id': category_id,
+                'amount': amount,
+                'business_unit_id': business_unit_id,
+            }])[0]
+        return request.env['res.partner.credit.exposure'].check_exposure(checks)
@@ -0,0 +1,35 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Merge duplicate credit lines before the unique constraint is created"""
+    if not version:
+        return
+
+    # Keep the oldest line of each (partner, category), with the most generous limit
+    cr.execute("""
+        WITH duplicates AS (
+            SELECT partner_id,
+                   product_category_id,
+                   MIN(id) AS keep_id,
+                   MAX(credit_limit) AS credit_limit,
+                   BOOL_OR(is_infinite_credit) AS is_infinite_credit
+              FROM res_partner_credit_line
+          GROUP BY partner_id, product_category_id
+            HAVING COUNT(*) > 1
+        ), merged AS (
+            UPDATE res_partner_credit_line line
+               SET credit_limit = d.credit_limit,
+                   is_infinite_credit = d.is_infinite_credit
+              FROM duplicates d
+             WHERE line.id = d.keep_id
+        )
+        DELETE FROM res_partner_credit_line line
+         USING duplicates d
+         WHERE line.partner_id = d.partner_id
+           AND line.product_category_id = d.product_category_id
+           AND line.id != d.keep_id
+    """)
+    _logger.info("Merged %s duplicate customer credit lines", cr.rowcount)
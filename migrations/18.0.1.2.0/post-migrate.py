@@ -0,0 +1,95 @@
+import json
+import logging
+
+from odoo import api, SUPERUSER_ID
+from odoo.tools import split_every
+from odoo.tools.sql import column_exists
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    _migrate_line_stash(cr)
+    _backfill_credit_info(cr)
+
+
+def _backfill_credit_info(cr):
+    """Compute the stored credit figures of the orders created before they were stored"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    SaleOrder = env['sale.order']
+    fnames = ['assigned_limit', 'limit_used', 'limit_remaining']
+
+    cr.execute("SELECT id FROM sale_order WHERE assigned_limit IS NULL ORDER BY id")
+    order_ids = [row[0] for row in cr.fetchall()]
+    for batch_ids in split_every(1000, order_ids):
+        orders = SaleOrder.browse(batch_ids)
+        for fname in fnames:
+            env.add_to_compute(SaleOrder._fields[fname], orders)
+        orders.flush_recordset(fnames)
+        orders.invalidate_recordset()
+    _logger.info("Computed the credit figures of %s sale orders", len(order_ids))
+
+
+def _parse_stashed_lines(raw):
+    """Line values of a JSON stash, or None when it does not parse"""
+    try:
+        lines = json.loads(raw)
+        return [
+            (int(line['product_id']), float(line.get('qty') or 1.0), float(line.get('price') or 0.0),
+             line['name'] if isinstance(line.get('name'), str) else None)
+            for line in lines
+        ]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+def _migrate_line_stash(cr):
+    """Move the JSON line stash of sale orders to sale.order.line.stash"""
+    # Each JSON field was only ever loaded for categories with the matching name
+    for column, name_pattern in [('snd_products_json', '%SND%'), ('fertilizer_products_json', '%FERTILIZER%')]:
+        if not column_exists(cr, 'sale_order', column):
+            continue
+        cr.execute(f"""
+            SELECT so.id, so.product_category_id, so.write_uid, so.{column}
+              FROM sale_order so
+              JOIN product_category pc ON pc.id = so.product_category_id
+             WHERE so.{column} IS NOT NULL
+               AND so.{column} NOT IN ('', '[]')
+               AND UPPER(pc.name::text) LIKE %s
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM sale_order_line_stash stash
+                     WHERE stash.order_id = so.id
+                       AND stash.product_category_id = so.product_category_id
+               )
+        """, [name_pattern])
+
+        # Parsed in Python so that one malformed stash does not abort the upgrade
+        columns = [[] for _ in range(8)]
+        skipped = 0
+        for order_id, category_id, write_uid, raw in cr.fetchall():
+            lines = _parse_stashed_lines(raw)
+            if lines is None:
+                skipped += 1
+                continue
+            for sequence, (product_id, qty, price, name) in enumerate(lines):
+                for values, value in zip(columns, (order_id, category_id, sequence, product_id, qty, price, name, write_uid)):
+                    values.append(value)
+        if skipped:
+            _logger.warning("Skipped %s sale orders whose %s is not valid JSON", skipped, column)
+        if not columns[0]:
+            continue
+
+        cr.execute("""
+            INSERT INTO sale_order_line_stash
+                   (order_id, product_category_id, sequence, product_id, product_uom_qty, price_unit, name,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT line.order_id, line.category_id, line.sequence, line.product_id, line.qty, line.price, line.name,
+                   line.write_uid, now() at time zone 'UTC', line.write_uid, now() at time zone 'UTC'
+              FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[], %s::float8[], %s::float8[], %s::text[], %s::int[])
+                   AS line(order_id, category_id, sequence, product_id, qty, price, name, write_uid)
+              JOIN product_product pp ON pp.id = line.product_id
+        """, columns)
+        _logger.info("Moved %s stashed lines from sale_order.%s", cr.rowcount, column)
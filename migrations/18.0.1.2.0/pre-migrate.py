@@ -0,0 +1,12 @@
+from odoo.tools.sql import column_exists, create_column
+
+
+def migrate(cr, version):
+    """Create the stored credit figures of sale orders empty, post-migrate fills them"""
+    if not version:
+        return
+
+    # Left NULL so the post-migrate knows which orders still need their figures
+    for column in ['assigned_limit', 'limit_used', 'limit_remaining']:
+        if not column_exists(cr, 'sale_order', column):
+            create_column(cr, 'sale_order', column, 'double precision')
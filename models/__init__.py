@@ -1,6 +1,10 @@
 from . import res_partner
+from . import credit_exposure
+from . import credit_event
 from . import sale_oder
+from . import sale_order_line_stash
 from . import account_payment
 from . import res_users
 # from . import overdue_receivable
-from . import product_category
\ No newline at end of file
+from . import product_category
+from . import credit_period
@@ -1,4 +1,6 @@
-from odoo import models, fields, api
+from collections import defaultdict
+
+from odoo import models, fields, api, Command
 
 
 class AccountPayment(models.Model):
@@ -12,6 +14,14 @@ class AccountPayment(models.Model):
         store=True
     )
 
+    credit_allocation_ids = fields.Many2many(
+        'account.partial.reconcile',
+        string='Credit Allocations',
+        copy=False,
+        readonly=True,
+        help='Reconciliations made against the open invoices of the category when the payment was posted'
+    )
+
     @api.model_create_multi
     def create(self, vals_list):
         records = super(AccountPayment, self).create(vals_list)
@@ -21,98 +31,78 @@ class AccountPayment(models.Model):
         """When payment is posted - RESTORE CREDIT IMMEDIATELY"""
         result = super(AccountPayment, self).action_post()
 
-        for payment in self:
-            if (payment.partner_type == 'customer' and
-                    payment.partner_id and
-                    payment.product_category_id):
-                # SIMPLE: Directly reduce credit used by payment amount
-                self._restore_credit_directly(payment)
+        # Payments registered on chosen invoices are reconciled with them by the wizard
+        if self.env.context.get('skip_credit_allocation'):
+            return result
 
-        return result
+        self.filtered(
+            lambda p: p.partner_type == 'customer' and p.partner_id and p.product_category_id
+        )._allocate_credit_fifo()
 
-    def _restore_credit_directly(self, payment):
-        """SIMPLE: Directly restore credit when payment is made"""
-        # Find credit line for this customer and category
-        credit_line = self.env['res.partner.credit.line'].search([
-            ('partner_id', '=', payment.partner_id.id),
-            ('product_category_id', '=', payment.product_category_id.id)
-        ], limit=1)
-
-        if credit_line:
-            # Find the corresponding sale order and invoice
-            sale_orders = self.env['sale.order'].search([
-                ('partner_id', '=', payment.partner_id.id),
-                ('product_category_id', '=', payment.product_category_id.id),
-                ('state', 'in', ['sale', 'done'])
-            ])
-
-            for order in sale_orders:
-                # Find invoice for this order
-                invoices = order.invoice_ids.filtered(
-                    lambda inv: inv.move_type == 'out_invoice' and inv.state == 'posted'
-                )
-
-                for invoice in invoices:
-                    if invoice.amount_residual > 0:
-                        # DIRECTLY reduce the invoice amount_residual
-                        payment_amount = min(payment.amount, invoice.amount_residual)
-                        new_residual = invoice.amount_residual - payment_amount
-
-                        # Update invoice residual directly
-                        invoice.write({'amount_residual': new_residual})
-
-                        # Force credit refresh
-                        credit_line._compute_credit_usage()
-
-                        # Force sale order refresh
-                        order._compute_credit_info()
-
-                        break
-
-    def action_cancel(self):
-        """When payment is cancelled - restore the credit usage"""
-        result = super(AccountPayment, self).action_cancel()
+        return result
 
+    def _get_fifo_invoice_lines(self):
+        """Return {(partner_id, category_id, account_id): receivable lines} of the open
+        customer invoices of these payments, oldest due date first, in one query"""
+        if not self:
+            return {}
+
+        self.env['account.move'].flush_model(
+            ['partner_id', 'product_category_id', 'is_open_receivable', 'invoice_date_due']
+        )
+        self.env['account.move.line'].flush_model(['move_id', 'account_id', 'reconciled', 'date_maturity'])
+        self.env.cr.execute("""
+            SELECT aml.id, am.partner_id, am.product_category_id, aml.account_id
+              FROM account_move am
+              JOIN account_move_line aml ON aml.move_id = am.id
+             WHERE am.is_open_receivable
+               AND am.partner_id = ANY(%s)
+               AND am.product_category_id = ANY(%s)
+               AND aml.account_id = ANY(%s)
+               AND NOT aml.reconciled
+          ORDER BY COALESCE(aml.date_maturity, am.invoice_date_due), am.id, aml.id
+        """, [self.partner_id.ids, self.product_category_id.ids, self.destination_account_id.ids])
+
+        line_ids = defaultdict(list)
+        for line_id, partner_id, category_id, account_id in self.env.cr.fetchall():
+            line_ids[(partner_id, category_id, account_id)].append(line_id)
+        return {key: self.env['account.move.line'].browse(ids) for key, ids in line_ids.items()}
+
+    def _allocate_credit_fifo(self):
+        """Spread each payment over the open invoices of its customer and category, oldest due first.
+
+        The allocations are real reconciliations, so the exposure ledger follows
+        them through account.partial.reconcile and cancelling reverses them exactly.
+        """
+        invoice_lines_by_key = self._get_fifo_invoice_lines()
         for payment in self:
-            if (payment.partner_type == 'customer' and
-                    payment.partner_id and
-                    payment.product_category_id):
-                # Restore credit usage when payment is cancelled
-                self._restore_credit_on_cancel(payment)
+            liquidity_lines, counterpart_lines, writeoff_lines = payment._seek_for_lines()
+            payment_lines = counterpart_lines.filtered(
+                lambda l: l.account_id == payment.destination_account_id and not l.reconciled
+            )
+            if not payment_lines:
+                continue
+
+            partials_before = payment_lines.matched_debit_ids
+            key = (payment.partner_id.id, payment.product_category_id.id, payment.destination_account_id.id)
+            for invoice_line in invoice_lines_by_key.get(key, []):
+                if all(payment_lines.mapped('reconciled')):
+                    break
+                # Already settled by a payment allocated before this one
+                if invoice_line.reconciled:
+                    continue
+                (payment_lines + invoice_line).reconcile()
 
-        return result
+            allocations = payment_lines.matched_debit_ids - partials_before
+            if allocations:
+                payment.credit_allocation_ids = [Command.link(partial.id) for partial in allocations]
 
-    def _restore_credit_on_cancel(self, payment):
-        """Restore credit usage when payment is cancelled"""
-        # Find credit line
-        credit_line = self.env['res.partner.credit.line'].search([
-            ('partner_id', '=', payment.partner_id.id),
-            ('product_category_id', '=', payment.product_category_id.id)
-        ], limit=1)
-
-        if credit_line:
-            # Find sale orders and invoices
-            sale_orders = self.env['sale.order'].search([
-                ('partner_id', '=', payment.partner_id.id),
-                ('product_category_id', '=', payment.product_category_id.id),
-                ('state', 'in', ['sale', 'done'])
-            ])
-
-            for order in sale_orders:
-                invoices = order.invoice_ids.filtered(
-                    lambda inv: inv.move_type == 'out_invoice' and inv.state == 'posted'
-                )
-
-                for invoice in invoices:
-                    # Increase the amount_residual back
-                    new_residual = invoice.amount_residual + payment.amount
-                    invoice.write({'amount_residual': new_residual})
-
-                    # Force refresh
-                    credit_line._compute_credit_usage()
-                    order._compute_credit_info()
+    def action_cancel(self):
+        """When payment is cancelled - give the allocated invoices their residual back"""
+        # Unreconciling lets the exposure ledger restore the credit through the partial hooks
+        self.credit_allocation_ids.unlink()
 
-                    break
+        return super(AccountPayment, self).action_cancel()
 
 
 class AccountMove(models.Model):
@@ -124,18 +114,3 @@ class AccountMove(models.Model):
         help='Product category for this invoice',
         store=True
     )
-
-    @api.model_create_multi
-    def create(self, vals_list):
-        records = super(AccountMove, self).create(vals_list)
-
-        # Auto-populate product category from sales order
-        for result in records:
-            if result.move_type == 'out_invoice' and result.invoice_origin:
-                sale_order = self.env['sale.order'].search([
-                    ('name', '=', result.invoice_origin)
-                ], limit=1)
-                if sale_order and hasattr(sale_order, 'product_category_id') and sale_order.product_category_id:
-                    result.product_category_id = sale_order.product_category_id.id
-
-        return records
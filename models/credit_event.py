@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+from odoo import models, api
+
+PENDING_EVENTS_KEY = 'customer_credit.events'
+
+# Tracked orders above which reconciliations leave the exposure to the background job
+DEFAULT_DEFER_THRESHOLD = 500
+
+
+class ResPartnerCreditEvent(models.AbstractModel):
+    _name = 'res.partner.credit.event'
+    _description = 'Customer Credit Event Dispatcher'
+
+    def _get_pending_events(self):
+        """Events collected during the current transaction, handled once before commit"""
+        data = self.env.cr.precommit.data
+        pending = data.get(PENDING_EVENTS_KEY)
+        if pending is None:
+            pending = data[PENDING_EVENTS_KEY] = {
+                'orders': {},
+                'deltas': defaultdict(float),
+                'overdue_partner_ids': set(),
+                'stale_pairs': set(),
+            }
+            self.env.cr.precommit.add(self._flush_events)
+        return pending
+
+    @api.model
+    def _track_orders(self, orders):
+        """Call before changing orders or their invoices: their exposure is
+        snapshotted the first time they are seen in the transaction"""
+        pending = self._get_pending_events()
+        new_orders = orders.filtered(lambda o: o.id not in pending['orders'])
+        if not new_orders:
+            return
+
+        snapshot = self.env['res.partner.credit.exposure']._snapshot_orders(new_orders)
+        for order in new_orders:
+            pending['orders'][order.id] = snapshot.get(order.id)
+
+    @api.model
+    def _track_reconciled_orders(self, orders):
+        """Like _track_orders, but once the transaction touches too many orders
+        their (customer, category) is handed to the background job instead"""
+        pending = self._get_pending_events()
+        threshold = int(self.env['ir.config_parameter'].sudo().get_param(
+            'customer_credit.defer_refresh_threshold', DEFAULT_DEFER_THRESHOLD))
+        if pending['stale_pairs'] or len(pending['orders']) + len(orders) > threshold:
+            pending['stale_pairs'].update(
+                (order.partner_id.id, order.product_category_id.id) for order in orders
+            )
+        else:
+            self._track_orders(orders)
+
+    @api.model
+    def _add_deltas(self, deltas):
+        """Queue signed exposure changes {(partner_id, category_id): delta}"""
+        pending = self._get_pending_events()
+        for pair, delta in deltas.items():
+            pending['deltas'][pair] += delta
+
+    @api.model
+    def _add_overdue_partners(self, partners):
+        """Queue customers whose overdue status must be refreshed"""
+        self._get_pending_events()['overdue_partner_ids'].update(partners.ids)
+
+    @api.model
+    def _flush_events(self):
+        """Apply the queued events, each (partner, category) and customer once"""
+        pending = self.env.cr.precommit.data.get(PENDING_EVENTS_KEY)
+        if not pending:
+            return
+
+        exposure = self.env['res.partner.credit.exposure']
+        deltas = pending['deltas']
+        if pending['orders']:
+            orders = self.env['sale.order'].browse(pending['orders'])
+            current = exposure._snapshot_orders(orders)
+            for order_id, before in pending['orders'].items():
+                after = current.get(order_id)
+                if before:
+                    deltas[before[:2]] -= before[2]
+                if after:
+                    deltas[after[:2]] += after[2]
+                # Later changes in the same transaction are measured from here
+                pending['orders'][order_id] = after
+
+        pending['deltas'] = defaultdict(float)
+        exposure._apply_deltas(deltas)
+
+        stale_pairs = pending['stale_pairs']
+        pending['stale_pairs'] = set()
+        if stale_pairs:
+            exposure._mark_stale(stale_pairs)
+
+        overdue_partner_ids = pending['overdue_partner_ids']
+        pending['overdue_partner_ids'] = set()
+        if overdue_partner_ids:
+            self.env['res.partner'].browse(overdue_partner_ids)._refresh_overdue_status()
+
+        # Precommit runs after the ORM flush, write what the handlers changed
+        self.env.flush_all()
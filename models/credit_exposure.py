@@ -0,0 +1,436 @@
+import logging
+from collections import defaultdict
+
+from psycopg2 import errors
+
+from odoo import models, fields, api
+from odoo.exceptions import AccessError, UserError
+from odoo.tools import split_every
+from odoo.tools.sql import column_exists, create_index
+
+from .res_partner import ORDER_EXPOSURE_QUERY
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK_TIMEOUT_MS = 2000
+
+# Largest number of (partner, category, amount) triples check_exposure accepts per call
+CHECK_EXPOSURE_MAX_BATCH = 1000
+
+
+class ResPartnerCreditExposure(models.Model):
+    _name = 'res.partner.credit.exposure'
+    _description = 'Customer Credit Exposure'
+    _rec_name = 'partner_id'
+
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Customer',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+
+    product_category_id = fields.Many2one(
+        'product.category',
+        string='Category',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+
+    amount_used = fields.Float(
+        string='Credit Used',
+        readonly=True,
+        help='Open exposure from confirmed orders and their posted invoices'
+    )
+
+    version = fields.Integer(
+        string='Version',
+        readonly=True,
+        help='Incremented every time the exposure changes'
+    )
+
+    needs_refresh = fields.Boolean(
+        string='Needs Refresh',
+        readonly=True,
+        help='Set when a large reconciliation deferred the update of this exposure to the background job'
+    )
+
+    _sql_constraints = [
+        ('partner_category_uniq', 'unique(partner_id, product_category_id)',
+         'Credit exposure already exists for this customer and category.'),
+    ]
+
+    def init(self):
+        # The background job only ever looks for stale rows
+        create_index(
+            self.env.cr,
+            'res_partner_credit_exposure_needs_refresh_idx',
+            self._table,
+            ['partner_id'],
+            where='needs_refresh',
+        )
+
+        # Fill the ledger the first time the module is installed. On a fresh
+        # install sale.order gets product_category_id after this model, and
+        # no order has a category to count yet.
+        if not column_exists(self.env.cr, 'sale_order', 'product_category_id'):
+            return
+        self.env.cr.execute("SELECT 1 FROM res_partner_credit_exposure LIMIT 1")
+        if not self.env.cr.fetchone():
+            # Orders may not have their credit columns yet, they are computed on their own install
+            self._rebuild_exposure(sync_credit_lines=False)
+
+    @api.model
+    def _read_exposure(self, pairs, refresh=True):
+        """Return {(partner_id, category_id): (amount_used, version)} for the given pairs.
+
+        With refresh=False the ledger is read as it is, without applying the
+        queued events nor rebuilding stale rows; fit for computed fields,
+        which the version bump of those updates recomputes anyway.
+        """
+        pairs = [(partner_id, category_id) for partner_id, category_id in pairs if partner_id and category_id]
+        if not pairs:
+            return {}
+
+        # Apply the credit events still queued in this transaction
+        if refresh:
+            self.env['res.partner.credit.event']._flush_events()
+        self.flush_model(['amount_used', 'version', 'needs_refresh'])
+        partner_ids, category_ids = zip(*pairs)
+        self.env.cr.execute("""
+            SELECT e.partner_id, e.product_category_id, e.amount_used, e.version, e.needs_refresh
+              FROM res_partner_credit_exposure e
+              JOIN unnest(%s::int[], %s::int[]) AS p(partner_id, category_id)
+                ON p.partner_id = e.partner_id AND p.category_id = e.product_category_id
+        """, [list(partner_ids), list(category_ids)])
+        rows = self.env.cr.fetchall()
+
+        # A check cannot wait for the background job, bring stale rows up to date now
+        stale_partner_ids = {partner_id for partner_id, *values, needs_refresh in rows if needs_refresh}
+        if refresh and stale_partner_ids:
+            self._rebuild_exposure(partner_ids=list(stale_partner_ids))
+            return self._read_exposure(pairs)
+
+        return {
+            (partner_id, category_id): (amount_used, version)
+            for partner_id, category_id, amount_used, version, needs_refresh in rows
+        }
+
+    @api.model
+    def _get_exposure(self, pairs, refresh=True):
+        """Return {(partner_id, category_id): amount_used} for the given pairs"""
+        return {
+            pair: amount_used
+            for pair, (amount_used, version) in self._read_exposure(pairs, refresh=refresh).items()
+        }
+
+    @api.model
+    def check_exposure(self, checks):
+        """Fast credit check for order channels: read-only, no ORM searches.
+
+        checks is a list of dicts with partner_id, category_id, amount and
+        optionally business_unit_id. Returns one dict per check with the limit,
+        used and remaining credit (None when infinite), the overdue buckets of
+        the customer and the approval step the order would land in. Each
+        check is judged on its own, amounts of the same batch are not summed.
+        """
+        # Raw SQL and cached lookups below bypass record rules: sales users only
+        if not self.env.su and not self.env.user.has_group('sales_team.group_sale_salesman'):
+            raise AccessError("Only sales users can check the credit exposure of customers.")
+        self._validate_exposure_checks(checks)
+
+        pairs = {(check['partner_id'], check['category_id']) for check in checks}
+        lines_by_pair = self.env['res.partner.credit.line']._get_credit_lines(pairs)
+        # The queued events and stale rows are left alone: this check writes nothing
+        usage = self._get_exposure(pairs, refresh=False)
+        aging = self.env['res.partner']._get_overdue_aging({partner_id for partner_id, category_id in pairs})
+
+        # The overdue rule depends on the business unit only, decide it once per unit and amount
+        sale_order = self.env['sale.order']
+        overdue_decisions = {}
+
+        results = []
+        for check in checks:
+            pair = (check['partner_id'], check['category_id'])
+            amount = check.get('amount') or 0.0
+            credit_line = lines_by_pair.get(pair)
+            overdue = aging[check['partner_id']]
+
+            decision_key = (check.get('business_unit_id') or False, overdue['total'])
+            if decision_key not in overdue_decisions:
+                order = sale_order.new({'business_unit': decision_key[0]})
+                overdue_decisions[decision_key] = order._get_overdue_decision(overdue['total'])[0]
+            has_overdue = overdue_decisions[decision_key]
+
+            credit_used = usage.get(pair, 0.0)
+            credit_limit = credit_remaining = None
+            if credit_line and not credit_line.is_infinite_credit:
+                credit_limit = credit_line.credit_limit
+                credit_remaining = credit_limit - credit_used
+
+            if not credit_line:
+                verdict = 'no_credit_line'
+            elif credit_remaining is not None and credit_remaining < amount:
+                verdict = 'sales_approval'
+            elif has_overdue:
+                verdict = 'accounting_approval'
+            else:
+                verdict = 'approved'
+
+            results.append({
+                'partner_id': pair[0],
+                'category_id': pair[1],
+                'amount': amount,
+                'credit_line_id': credit_line.id if credit_line else False,
+                'is_infinite_credit': bool(credit_line and credit_line.is_infinite_credit),
+                'credit_limit': credit_limit,
+                'credit_used': credit_used,
+                'credit_remaining': credit_remaining,
+                'overdue': overdue,
+                'verdict': verdict,
+            })
+        return results
+
+    @api.model
+    def _validate_exposure_checks(self, checks):
+        """Reject check_exposure input that is not a list of well-formed checks"""
+        if not isinstance(checks, list):
+            raise UserError("Credit checks must be sent as a list.")
+        if len(checks) > CHECK_EXPOSURE_MAX_BATCH:
+            raise UserError(f"At most {CHECK_EXPOSURE_MAX_BATCH} credit checks can be made per call.")
+
+        def is_id(value):
+            return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+        for index, check in enumerate(checks):
+            if not isinstance(check, dict):
+                raise UserError(f"Credit check #{index + 1} must be an object.")
+            if not is_id(check.get('partner_id')) or not is_id(check.get('category_id')):
+                raise UserError(f"Credit check #{index + 1} needs a partner_id and a category_id.")
+            amount = check.get('amount')
+            if amount is not None and (isinstance(amount, bool) or not isinstance(amount, (int, float))):
+                raise UserError(f"Credit check #{index + 1} has an amount that is not a number.")
+            if check.get('business_unit_id') and not is_id(check['business_unit_id']):
+                raise UserError(f"Credit check #{index + 1} has an invalid business_unit_id.")
+
+    @api.model
+    def _bump_versions(self, pairs):
+        """Invalidate the credit checks made against these pairs"""
+        pairs = [(partner_id, category_id) for partner_id, category_id in pairs if partner_id and category_id]
+        if not pairs:
+            return
+
+        self.flush_model(['version'])
+        partner_ids, category_ids = zip(*pairs)
+        self.env.cr.execute("""
+            UPDATE res_partner_credit_exposure e
+               SET version = e.version + 1
+              FROM unnest(%s::int[], %s::int[]) AS p(partner_id, category_id)
+             WHERE p.partner_id = e.partner_id AND p.category_id = e.product_category_id
+         RETURNING e.partner_id, e.product_category_id, e.version
+        """, [list(partner_ids), list(category_ids)])
+        self.invalidate_model(['version'])
+        self._sync_credit_lines(self.env.cr.fetchall())
+
+    @api.model
+    def _mark_stale(self, pairs):
+        """Leave the update of these pairs to the background job"""
+        pairs = sorted({(partner_id, category_id) for partner_id, category_id in pairs if partner_id and category_id})
+        if not pairs:
+            return
+
+        partner_ids, category_ids = zip(*pairs)
+        self.flush_model()
+        self.env.cr.execute("""
+            INSERT INTO res_partner_credit_exposure
+                   (partner_id, product_category_id, amount_used, version, needs_refresh,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT p.partner_id, p.category_id, 0, 1, TRUE,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM unnest(%(partners)s::int[], %(categories)s::int[]) AS p(partner_id, category_id)
+            ON CONFLICT (partner_id, product_category_id) DO UPDATE
+               SET needs_refresh = TRUE,
+                   version = res_partner_credit_exposure.version + 1
+         RETURNING partner_id, product_category_id, version
+        """, {
+            'uid': self.env.uid,
+            'partners': list(partner_ids),
+            'categories': list(category_ids),
+        })
+        self.invalidate_model(['version', 'needs_refresh'])
+        self._sync_credit_lines(self.env.cr.fetchall())
+
+        cron = self.env.ref(f'{self._module}.ir_cron_refresh_stale_exposure', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _cron_refresh_stale_exposure(self, batch_size=1000):
+        """Rebuild the exposure deferred by large reconciliations, each customer once"""
+        self.flush_model(['partner_id', 'needs_refresh'])
+        self.env.cr.execute("SELECT DISTINCT partner_id FROM res_partner_credit_exposure WHERE needs_refresh")
+        partner_ids = [row[0] for row in self.env.cr.fetchall()]
+        for batch_ids in split_every(batch_size, partner_ids):
+            self._rebuild_exposure(partner_ids=list(batch_ids))
+
+    @api.model
+    def _apply_deltas(self, deltas):
+        """Add signed amounts {(partner_id, category_id): delta} to the ledger"""
+        deltas = {key: delta for key, delta in deltas.items() if all(key) and delta}
+        if not deltas:
+            return
+
+        partner_ids, category_ids = zip(*deltas)
+        self.flush_model()
+        self.env.cr.execute("""
+            INSERT INTO res_partner_credit_exposure
+                   (partner_id, product_category_id, amount_used, version,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT d.partner_id, d.category_id, d.amount, 1,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM unnest(%(partners)s::int[], %(categories)s::int[], %(amounts)s::float8[])
+                   AS d(partner_id, category_id, amount)
+            ON CONFLICT (partner_id, product_category_id) DO UPDATE
+               SET amount_used = res_partner_credit_exposure.amount_used + EXCLUDED.amount_used,
+                   version = res_partner_credit_exposure.version + 1,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+         RETURNING partner_id, product_category_id, version
+        """, {
+            'uid': self.env.uid,
+            'partners': list(partner_ids),
+            'categories': list(category_ids),
+            'amounts': list(deltas.values()),
+        })
+        self.invalidate_model(['amount_used', 'version'])
+        self._sync_credit_lines(self.env.cr.fetchall())
+
+    @api.model
+    def _lock_exposure(self, pairs):
+        """Lock the ledger rows of pairs until the end of the transaction.
+
+        Waits at most customer_credit.lock_timeout_ms. A timeout raises
+        LockNotAvailable and a row changed meanwhile raises a serialization
+        failure; the RPC layer retries both.
+        """
+        pairs = sorted({(partner_id, category_id) for partner_id, category_id in pairs if partner_id and category_id})
+        if not pairs:
+            return
+
+        timeout = int(self.env['ir.config_parameter'].sudo().get_param(
+            'customer_credit.lock_timeout_ms', DEFAULT_LOCK_TIMEOUT_MS))
+        partner_ids, category_ids = zip(*pairs)
+        params = {
+            'uid': self.env.uid,
+            'partners': list(partner_ids),
+            'categories': list(category_ids),
+        }
+        self.flush_model()
+        try:
+            self.env.cr.execute("SET LOCAL lock_timeout = %s", [f'{timeout}ms'])
+            # Every pair needs a row to lock
+            self.env.cr.execute("""
+                INSERT INTO res_partner_credit_exposure
+                       (partner_id, product_category_id, amount_used, version,
+                        create_uid, create_date, write_uid, write_date)
+                SELECT p.partner_id, p.category_id, 0, 1,
+                       %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+                  FROM unnest(%(partners)s::int[], %(categories)s::int[]) AS p(partner_id, category_id)
+                ON CONFLICT (partner_id, product_category_id) DO NOTHING
+            """, params)
+            # Lock in id order so concurrent confirmers cannot deadlock
+            self.env.cr.execute("""
+                SELECT e.id
+                  FROM res_partner_credit_exposure e
+                  JOIN unnest(%(partners)s::int[], %(categories)s::int[]) AS p(partner_id, category_id)
+                    ON p.partner_id = e.partner_id AND p.category_id = e.product_category_id
+              ORDER BY e.id
+                   FOR UPDATE OF e
+            """, params)
+            self.env.cr.execute("SET LOCAL lock_timeout TO DEFAULT")
+        except errors.LockNotAvailable:
+            _logger.warning(
+                "Credit exposure of %s is locked by another confirmation for more than %sms, retrying",
+                pairs, timeout,
+            )
+            raise
+
+    @api.model
+    def _rebuild_exposure(self, partner_ids=None, sync_credit_lines=True):
+        """Recompute the ledger from scratch, for some partners or for everybody"""
+        self.env['res.partner.credit.event']._flush_events()
+        self.env['res.partner.credit.line']._flush_credit_usage_sources()
+        self.flush_model()
+
+        scope = "partner_id = ANY(%(partners)s)" if partner_ids else "TRUE"
+        params = {'uid': self.env.uid, 'partners': list(partner_ids or [])}
+        exposure_query = ORDER_EXPOSURE_QUERY.format(
+            where="so.product_category_id IS NOT NULL AND "
+                  + ("so.partner_id = ANY(%(partners)s)" if partner_ids else "TRUE")
+        )
+
+        # Reset rows that no longer have any open order, then upsert the real totals
+        self.env.cr.execute(f"""
+            UPDATE res_partner_credit_exposure
+               SET amount_used = 0, version = version + 1, needs_refresh = FALSE
+             WHERE {scope} AND (amount_used != 0 OR needs_refresh)
+         RETURNING partner_id, product_category_id, version
+        """, params)
+        versions = self.env.cr.fetchall()
+        self.env.cr.execute(f"""
+            INSERT INTO res_partner_credit_exposure
+                   (partner_id, product_category_id, amount_used, version,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT exposure.partner_id, exposure.product_category_id, SUM(exposure.amount), 1,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM ({exposure_query}) exposure
+          GROUP BY exposure.partner_id, exposure.product_category_id
+            ON CONFLICT (partner_id, product_category_id) DO UPDATE
+               SET amount_used = EXCLUDED.amount_used,
+                   version = res_partner_credit_exposure.version + 1,
+                   needs_refresh = FALSE,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+         RETURNING partner_id, product_category_id, version
+        """, params)
+        versions += self.env.cr.fetchall()
+        self.invalidate_model(['amount_used', 'version', 'needs_refresh'])
+        if sync_credit_lines:
+            self._sync_credit_lines(versions)
+        return True
+
+    @api.model
+    def _sync_credit_lines(self, versions):
+        """Copy ledger versions [(partner_id, category_id, version)] to the credit lines.
+
+        Written through the ORM so the stored credit figures of the quotations
+        depending on exposure_version are recomputed, once per credit line.
+        """
+        # A pair reset then upserted by a rebuild comes back twice, keep its last version
+        versions = {(partner_id, category_id): version for partner_id, category_id, version in versions}
+        lines_by_pair = self.env['res.partner.credit.line']._get_credit_lines(versions)
+
+        line_ids_by_version = defaultdict(list)
+        for pair, line in lines_by_pair.items():
+            if line.exposure_version != versions[pair]:
+                line_ids_by_version[versions[pair]].append(line.id)
+        for version, line_ids in line_ids_by_version.items():
+            self.env['res.partner.credit.line'].browse(line_ids).sudo().write({'exposure_version': version})
+
+    @api.model
+    def _snapshot_orders(self, orders):
+        """Return {order_id: (partner_id, category_id, amount)} for confirmed orders"""
+        if not orders:
+            return {}
+
+        self.env['res.partner.credit.line']._flush_credit_usage_sources()
+        self.env.cr.execute(
+            ORDER_EXPOSURE_QUERY.format(where="so.id = ANY(%s)"),
+            [orders.ids]
+        )
+        return {
+            order_id: (partner_id, category_id, amount or 0.0)
+            for order_id, partner_id, category_id, amount in self.env.cr.fetchall()
+        }
@@ -0,0 +1,38 @@
+from odoo import models, api, tools
+
+
+class CreditPeriod(models.Model):
+    _inherit = 'credit.period'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(CreditPeriod, self).create(vals_list)
+        self.env.registry.clear_cache()
+        return records
+
+    def write(self, vals):
+        result = super(CreditPeriod, self).write(vals)
+        self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super(CreditPeriod, self).unlink()
+        self.env.registry.clear_cache()
+        return result
+
+    @api.model
+    @tools.ormcache()
+    def _get_payment_term_matrix(self):
+        """Return {(category_id, state_id): payment_term_id} of every credit period, once per worker"""
+        matrix = {}
+        for period in self.sudo().search_read([('credit_days', '!=', False)], ['category_id', 'state_id', 'credit_days']):
+            if period['category_id'] and period['state_id']:
+                # Same precedence as a search with limit=1: the first period in model order wins
+                matrix.setdefault((period['category_id'][0], period['state_id'][0]), period['credit_days'][0])
+        return matrix
+
+    @api.model
+    def _get_payment_terms(self, pairs):
+        """Return {(category_id, state_id): payment_term_id} for the pairs that have a credit period"""
+        matrix = self._get_payment_term_matrix()
+        return {pair: matrix[pair] for pair in pairs if pair in matrix}
@@ -1,5 +1,47 @@
-from odoo import models, fields, api, _
+import logging
+from collections import defaultdict
+
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+# Per-worker counters of the (partner, category) -> credit line resolver
+CREDIT_LINE_CACHE_STATS = {'lookups': 0, 'misses': 0}
+
+# Credit exposure of each confirmed order: the residual of its posted customer
+# invoices, or its full amount while it has no posted invoice yet.
+ORDER_EXPOSURE_QUERY = """
+    SELECT so.id AS order_id,
+           so.partner_id,
+           so.product_category_id,
+           COALESCE(inv.residual, so.amount_total) AS amount
+      FROM sale_order so
+ LEFT JOIN LATERAL (
+            SELECT SUM(am.amount_residual) AS residual
+              FROM account_move am
+             WHERE am.move_type = 'out_invoice'
+               AND am.state = 'posted'
+               AND am.id IN (
+                    SELECT aml.move_id
+                      FROM sale_order_line sol
+                      JOIN sale_order_line_invoice_rel rel ON rel.order_line_id = sol.id
+                      JOIN account_move_line aml ON aml.id = rel.invoice_line_id
+                     WHERE sol.order_id = so.id
+               )
+           ) inv ON TRUE
+     WHERE so.state IN ('sale', 'done')
+       AND {where}
+"""
+
+# Default overdue aging buckets: (key, first day overdue, last day overdue or None)
+OVERDUE_AGING_BUCKETS = [
+    ('1_30', 1, 30),
+    ('31_60', 31, 60),
+    ('61_90', 61, 90),
+    ('90_plus', 91, None),
+]
 
 
 class ResPartner(models.Model):
@@ -21,6 +63,107 @@ class ResPartner(models.Model):
         string='Credit Lines'
     )
 
+    total_overdue = fields.Float(
+        string='Total Overdue',
+        readonly=True,
+        index=True,
+        help='Overdue amount from aged receivable (1-30 days only)'
+    )
+
+    bypass_approval = fields.Boolean(
+        string='Bypass Approval',
+        readonly=True,
+        help='True if overdue is within 1-31 days range - bypass approval'
+    )
+
+    @api.model
+    def _get_overdue_aging(self, partner_ids, as_of=None, buckets=None):
+        """Age the open customer invoices of many partners in one grouped query.
+
+        Returns {partner_id: {bucket_key: amount, 'total': amount}} where
+        'total' holds every amount overdue by at least one day on as_of.
+        """
+        buckets = buckets or OVERDUE_AGING_BUCKETS
+        as_of = as_of or fields.Date.context_today(self)
+        keys = [key for key, first_day, last_day in buckets] + ['total']
+        aging = {partner_id: dict.fromkeys(keys, 0.0) for partner_id in partner_ids}
+        if not partner_ids:
+            return aging
+
+        self.env['account.move'].flush_model(
+            ['partner_id', 'is_open_receivable', 'amount_residual', 'invoice_date_due']
+        )
+
+        params = {'as_of': as_of, 'partners': list(partner_ids)}
+        columns = []
+        for index, (key, first_day, last_day) in enumerate(buckets):
+            condition = f"%(as_of)s::date - am.invoice_date_due >= %(first_{index})s"
+            params[f'first_{index}'] = first_day
+            if last_day is not None:
+                condition += f" AND %(as_of)s::date - am.invoice_date_due <= %(last_{index})s"
+                params[f'last_{index}'] = last_day
+            columns.append(f"SUM(CASE WHEN {condition} THEN am.amount_residual ELSE 0 END)")
+        columns.append("SUM(am.amount_residual)")
+
+        self.env.cr.execute(f"""
+            SELECT am.partner_id, {', '.join(columns)}
+              FROM account_move am
+             WHERE am.partner_id = ANY(%(partners)s)
+               AND am.is_open_receivable
+               AND am.invoice_date_due < %(as_of)s::date
+          GROUP BY am.partner_id
+        """, params)
+        for partner_id, *amounts in self.env.cr.fetchall():
+            aging[partner_id] = dict(zip(keys, (amount or 0.0 for amount in amounts)))
+        return aging
+
+    def _refresh_overdue_status(self):
+        """Store total_overdue and bypass_approval from one aging pass"""
+        customers = self.filtered('customer_rank')
+        aging = self._get_overdue_aging(
+            customers.ids,
+            buckets=[('1_30', 1, 30), ('within_31', 1, 31), ('beyond_31', 32, None)]
+        )
+
+        # Group partners by their new values so unchanged ones are not written
+        updates = defaultdict(list)
+        for partner in self:
+            total_overdue = 0.0
+            bypass_approval = False
+
+            if partner.customer_rank:
+                # Only 1-30 days counts as total overdue
+                total_overdue = aging[partner.id]['1_30']
+
+                # Bypass approval only if has overdue within 1-31 days and no overdue beyond 31 days
+                bypass_approval = aging[partner.id]['within_31'] > 0 and not aging[partner.id]['beyond_31'] > 0
+
+            if partner.total_overdue != total_overdue or partner.bypass_approval != bypass_approval:
+                updates[(total_overdue, bypass_approval)].append(partner.id)
+
+        for (total_overdue, bypass_approval), partner_ids in updates.items():
+            self.browse(partner_ids).sudo().write({
+                'total_overdue': total_overdue,
+                'bypass_approval': bypass_approval,
+            })
+
+    @api.model
+    def _cron_refresh_overdue_status(self, batch_size=1000):
+        """Daily refresh: invoices age into new buckets even when nothing is posted"""
+        self.env['account.move'].flush_model(['partner_id', 'is_open_receivable'])
+        self.env.cr.execute("""
+            SELECT DISTINCT partner_id
+              FROM account_move
+             WHERE is_open_receivable AND partner_id IS NOT NULL
+             UNION
+            SELECT id
+              FROM res_partner
+             WHERE total_overdue != 0 OR bypass_approval
+        """)
+        partner_ids = [row[0] for row in self.env.cr.fetchall()]
+        for batch_ids in split_every(batch_size, partner_ids):
+            self.browse(batch_ids)._refresh_overdue_status()
+
 
 class ResPartnerCreditLine(models.Model):
     _name = 'res.partner.credit.line'
@@ -71,34 +214,26 @@ class ResPartnerCreditLine(models.Model):
         help='Remaining credit for display'
     )
 
+    exposure_version = fields.Integer(
+        string='Exposure Version',
+        readonly=True,
+        help='Version of the exposure ledger row, quotation credit figures are recomputed when it changes'
+    )
+
+    _sql_constraints = [
+        ('partner_category_uniq', 'unique(partner_id, product_category_id)',
+         'Credit line for this category already exists.'),
+    ]
+
     @api.depends('partner_id', 'product_category_id', 'credit_limit', 'is_infinite_credit')
     def _compute_credit_usage(self):
-        """Calculate credit - STEP BY STEP METHOD"""
+        """Read credit used from the exposure ledger for the whole recordset"""
+        # Read the ledger as it is: a plain read of credit lines must not apply events nor rebuild rows
+        usage = self.env['res.partner.credit.exposure']._get_exposure(
+            [(line.partner_id.id, line.product_category_id.id) for line in self], refresh=False
+        )
         for line in self:
-            credit_used = 0.0
-
-            if line.partner_id and line.product_category_id:
-                # STEP 1: Find confirmed orders (when order is confirmed, this shows credit used)
-                confirmed_orders = self.env['sale.order'].search([
-                    ('partner_id', '=', line.partner_id.id),
-                    ('product_category_id', '=', line.product_category_id.id),
-                    ('state', 'in', ['sale', 'done'])
-                ])
-
-                for order in confirmed_orders:
-                    # STEP 2: Check if order has invoices
-                    posted_invoices = order.invoice_ids.filtered(
-                        lambda inv: inv.move_type == 'out_invoice' and inv.state == 'posted'
-                    )
-
-                    if posted_invoices:
-                        # STEP 3: For invoiced orders, use amount_residual (reduces when payment made)
-                        for invoice in posted_invoices:
-                            credit_used += invoice.amount_residual
-                    else:
-                        # STEP 4: For confirmed but not invoiced orders, use full amount
-                        credit_used += order.amount_total
-
+            credit_used = usage.get((line.partner_id.id, line.product_category_id.id), 0.0)
             line.credit_used = credit_used
 
             # Calculate remaining credit
@@ -109,6 +244,102 @@ class ResPartnerCreditLine(models.Model):
                 line.credit_remaining = line.credit_limit - credit_used
                 line.credit_remaining_display = f"{line.credit_remaining:,.2f}"
 
+    def _flush_credit_usage_sources(self):
+        """Flush every field read by the credit usage SQL"""
+        self.env['sale.order'].flush_model(['partner_id', 'product_category_id', 'state', 'amount_total'])
+        self.env['sale.order.line'].flush_model(['order_id', 'invoice_lines'])
+        self.env['account.move.line'].flush_model(['move_id'])
+        self.env['account.move'].flush_model(['move_type', 'state', 'amount_residual'])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(ResPartnerCreditLine, self).create(vals_list)
+        self.env.registry.clear_cache()
+        records._recompute_quotations()
+        return records
+
+    def write(self, vals):
+        if 'partner_id' in vals or 'product_category_id' in vals:
+            # Quotations of the old pairs lose their credit line
+            self._recompute_quotations()
+
+        result = super(ResPartnerCreditLine, self).write(vals)
+
+        if 'partner_id' in vals or 'product_category_id' in vals:
+            self.env.registry.clear_cache()
+            self._recompute_quotations()
+
+        # A new limit makes every earlier credit check of these pairs stale
+        if any(field in vals for field in ['partner_id', 'product_category_id', 'credit_limit', 'is_infinite_credit']):
+            self.env['res.partner.credit.exposure']._bump_versions(
+                [(line.partner_id.id, line.product_category_id.id) for line in self]
+            )
+
+        return result
+
+    def unlink(self):
+        result = super(ResPartnerCreditLine, self).unlink()
+        self.env.registry.clear_cache()
+        return result
+
+    def _recompute_quotations(self):
+        """Recompute the credit line and stored credit figures of the quotations
+        of these customers and categories"""
+        if not self:
+            return
+        orders = self.env['sale.order'].search([
+            ('partner_id', 'in', self.partner_id.ids),
+            ('product_category_id', 'in', self.product_category_id.ids),
+            ('state', 'in', ['draft', 'sent']),
+        ])
+        for fname in ['credit_line_id', 'assigned_limit', 'limit_used', 'limit_remaining']:
+            self.env.add_to_compute(orders._fields[fname], orders)
+
+    @api.model
+    def _get_credit_line(self, partner_id, category_id):
+        """Return the credit line of a customer and category through the worker cache"""
+        CREDIT_LINE_CACHE_STATS['lookups'] += 1
+        return self.browse(self._get_credit_line_id(partner_id, category_id))
+
+    @api.model
+    def _get_credit_lines(self, pairs):
+        """Return {(partner_id, category_id): credit line} for the pairs that have one"""
+        line_ids = {}
+        for partner_id, category_id in pairs:
+            CREDIT_LINE_CACHE_STATS['lookups'] += 1
+            line_id = self._get_credit_line_id(partner_id, category_id)
+            if line_id:
+                line_ids[(partner_id, category_id)] = line_id
+
+        # Browse every line together so their fields are prefetched in one query
+        lines_by_id = {line.id: line for line in self.browse(line_ids.values())}
+        return {pair: lines_by_id[line_id] for pair, line_id in line_ids.items()}
+
+    @api.model
+    @tools.ormcache('partner_id', 'category_id')
+    def _get_credit_line_id(self, partner_id, category_id):
+        CREDIT_LINE_CACHE_STATS['misses'] += 1
+        if not partner_id or not category_id:
+            return False
+        return self.search([
+            ('partner_id', '=', partner_id),
+            ('product_category_id', '=', category_id)
+        ], limit=1).id
+
+    @api.model
+    def _get_credit_line_cache_stats(self):
+        """Hit rate of the credit line resolver in this worker"""
+        lookups = CREDIT_LINE_CACHE_STATS['lookups']
+        misses = CREDIT_LINE_CACHE_STATS['misses']
+        stats = {
+            'lookups': lookups,
+            'hits': lookups - misses,
+            'misses': misses,
+            'hit_rate': (lookups - misses) / lookups if lookups else 0.0,
+        }
+        _logger.info("Credit line cache: %(hits)s hits, %(misses)s misses, hit rate %(hit_rate).2f", stats)
+        return stats
+
     @api.constrains('credit_limit', 'is_infinite_credit')
     def _check_credit_limit(self):
         for record in self:
@@ -116,24 +347,14 @@ class ResPartnerCreditLine(models.Model):
                 if record.credit_limit < 0:
                     raise ValidationError(_("Credit limit cannot be negative."))
 
-    @api.constrains('partner_id', 'product_category_id')
-    def _check_unique_category(self):
-        for record in self:
-            existing = self.search([
-                ('partner_id', '=', record.partner_id.id),
-                ('product_category_id', '=', record.product_category_id.id),
-                ('id', '!=', record.id)
-            ])
-            if existing:
-                raise ValidationError(_("Credit line for this category already exists."))
-
     @api.onchange('is_infinite_credit')
     def _onchange_is_infinite_credit(self):
         if self.is_infinite_credit:
             self.credit_limit = 0.0
 
     def force_refresh_credit(self):
-        """Method to force refresh credit calculation"""
+        """Rebuild the exposure ledger of these customers to repair any drift"""
+        self.env['res.partner.credit.exposure']._rebuild_exposure(partner_ids=self.partner_id.ids)
         self._compute_credit_usage()
         return True
 
@@ -1,6 +1,8 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, Command
 from odoo.exceptions import ValidationError, UserError
-import json
+from odoo.tools.sql import column_exists, create_column, create_index
+from odoo.tools import float_repr
+from collections import Counter, defaultdict
 
 
 class SaleOrder(models.Model):
@@ -36,17 +38,6 @@ class SaleOrder(models.Model):
         # ... keep all other existing attributes
     )
 
-    # Hidden storage fields
-    snd_products_json = fields.Text(
-        string='SND Products Storage',
-        default='[]'
-    )
-
-    fertilizer_products_json = fields.Text(
-        string='Fertilizer Products Storage',
-        default='[]'
-    )
-
     # Credit control fields
     credit_checked = fields.Boolean(
         string='Credit Checked',
@@ -98,6 +89,34 @@ class SaleOrder(models.Model):
         help='Accounting person has approved overdue check'
     )
 
+    approval_state = fields.Selection(
+        [
+            ('to_check', 'Credit Not Checked'),
+            ('sales_approval', 'Awaiting Sales Approval'),
+            ('accounting_approval', 'Awaiting Accounting Approval'),
+            ('approved', 'Ready to Confirm'),
+        ],
+        string='Approval State',
+        compute='_compute_approval_state',
+        store=True,
+        index=True,
+        help='Where the quotation stands in the credit approval flow, empty once it is no longer a draft'
+    )
+
+    credit_check_fingerprint = fields.Char(
+        string='Credit Check Fingerprint',
+        copy=False,
+        readonly=True,
+        help='Customer, category, amount and exposure version the last credit check was made against'
+    )
+
+    line_stash_snapshot = fields.Json(
+        string='Line Stash Snapshot',
+        store=False,
+        copy=False,
+        help='Lines of the other categories while the form is being edited, stashed on save'
+    )
+
     customer_overdue_amount = fields.Float(
         string='Customer Overdue Amount',
         compute='_compute_customer_overdue',
@@ -125,22 +144,34 @@ class SaleOrder(models.Model):
         compute='_compute_button_visibility'
     )
 
+    credit_line_id = fields.Many2one(
+        'res.partner.credit.line',
+        string='Credit Line',
+        compute='_compute_credit_line_id',
+        store=True,
+        index='btree_not_null',
+        help='Credit line of the customer and category, while the order is a quotation'
+    )
+
     # Credit limit information fields
     assigned_limit = fields.Float(
         string='Assigned Limit',
         compute='_compute_credit_info',
+        store=True,
         help='Credit limit assigned to customer for selected category'
     )
 
     limit_used = fields.Float(
         string='Limit Used',
         compute='_compute_credit_info',
+        store=True,
         help='Amount of credit used from confirmed sales orders'
     )
 
     limit_remaining = fields.Float(
         string='Limit Remaining',
         compute='_compute_credit_info',
+        store=True,
         help='Remaining credit available for customer'
     )
 
@@ -149,83 +180,79 @@ class SaleOrder(models.Model):
         compute='_compute_credit_info_visible'
     )
 
+    def _auto_init(self):
+        # On upgrade, fill the new column in SQL instead of recomputing every order.
+        # On a fresh install the flag columns do not exist yet and the ORM computes it.
+        approval_flags = ['credit_checked', 'credit_exceeded', 'credit_override_approved',
+                          'has_overdue', 'overdue_check_approved']
+        if not column_exists(self.env.cr, 'sale_order', 'approval_state') and all(
+            column_exists(self.env.cr, 'sale_order', column) for column in approval_flags
+        ):
+            create_column(self.env.cr, 'sale_order', 'approval_state', 'varchar')
+            self.env.cr.execute("""
+                UPDATE sale_order
+                   SET approval_state = CASE
+                       WHEN NOT COALESCE(credit_checked, FALSE) THEN 'to_check'
+                       WHEN credit_exceeded AND NOT COALESCE(credit_override_approved, FALSE) THEN 'sales_approval'
+                       WHEN has_overdue AND NOT COALESCE(overdue_check_approved, FALSE) THEN 'accounting_approval'
+                       ELSE 'approved'
+                   END
+                 WHERE state = 'draft'
+            """)
+        return super(SaleOrder, self)._auto_init()
+
     @api.depends('partner_id')
     def _compute_customer_overdue(self):
         """Compute customer's total overdue amount"""
+        # Every overdue amount counts here (res.partner.total_overdue only holds 1-30 days),
+        # aged for all partners in one pass
+        aging = self.env['res.partner']._get_overdue_aging(self.partner_id.ids)
+
         for order in self:
             overdue_amount = 0.0
             if order.partner_id:
-                # Get partner's total_overdue field (assuming it exists in res.partner)
-                if hasattr(order.partner_id, 'total_overdue'):
-                    overdue_amount = order.partner_id.total_overdue
-                else:
-                    # Fallback: Calculate overdue from invoices
-                    overdue_invoices = self.env['account.move'].search([
-                        ('partner_id', '=', order.partner_id.id),
-                        ('move_type', '=', 'out_invoice'),
-                        ('state', '=', 'posted'),
-                        ('amount_residual', '>', 0),
-                        ('invoice_date_due', '<', fields.Date.today())
-                    ])
-                    overdue_amount = sum(overdue_invoices.mapped('amount_residual'))
+                overdue_amount = aging[order.partner_id.id]['total']
 
             order.customer_overdue_amount = overdue_amount
 
     @api.depends('credit_checked', 'credit_exceeded', 'credit_override_approved', 'has_overdue',
-                 'overdue_check_approved', 'state', 'partner_id', 'product_category_id', 'order_line')
+                 'overdue_check_approved', 'state')
+    def _compute_approval_state(self):
+        """Stored approval step, so approver queues are plain indexed searches"""
+        for order in self:
+            if order.state != 'draft':
+                order.approval_state = False
+            elif not order.credit_checked:
+                order.approval_state = 'to_check'
+            # Credit override comes first (sales person), then the overdue check (accounting person)
+            elif order.credit_exceeded and not order.credit_override_approved:
+                order.approval_state = 'sales_approval'
+            elif order.has_overdue and not order.overdue_check_approved:
+                order.approval_state = 'accounting_approval'
+            else:
+                order.approval_state = 'approved'
+
+    @api.depends('approval_state', 'partner_id', 'product_category_id', 'order_line')
     def _compute_button_visibility(self):
         """Compute button visibility based on current state and user permissions"""
+        # Get current user permissions
+        current_user = self.env.user
+        is_sales_person = current_user.is_sales_person_credit
+        is_accounting_person = current_user.is_accounting_person_credit
+
         for order in self:
-            # Reset all buttons
-            show_check_credit = False
-            show_credit_override = False
-            show_overdue_check = False
-            show_confirm = False
-
-            if order.state == 'draft':
-                # Get current user permissions
-                current_user = self.env.user
-                is_sales_person = current_user.is_sales_person_credit
-                is_accounting_person = current_user.is_accounting_person_credit
-
-                # Step 1: Show Check Credit button when order is ready but credit not checked
-                if (order.partner_id and order.product_category_id and
-                        order.order_line and not order.credit_checked):
-                    show_check_credit = True
-
-                # Step 2: After credit check - determine next action based on user role
-                elif order.credit_checked:
-
-                    # Case A: Credit exceeded - show override button for sales person, nothing for others
-                    if order.credit_exceeded and not order.credit_override_approved:
-                        if is_sales_person:
-                            show_credit_override = True
-                        # For non-sales persons, don't show any button if credit exceeded
-
-                    # Case B: Credit OK but has overdue - show overdue check ONLY for accounting person
-                    elif not order.credit_exceeded and order.has_overdue and not order.overdue_check_approved:
-                        if is_accounting_person:
-                            show_overdue_check = True
-                        # For non-accounting persons, don't show any button if overdue exists
-
-                    # Case C: Both credit exceeded AND has overdue
-                    elif order.credit_exceeded and order.has_overdue:
-                        # Priority 1: Credit override needed first (sales person only)
-                        if not order.credit_override_approved:
-                            if is_sales_person:
-                                show_credit_override = True
-                        # Priority 2: After credit override, overdue check needed (accounting person only)
-                        elif order.credit_override_approved and not order.overdue_check_approved:
-                            if is_accounting_person:
-                                show_overdue_check = True
-                        # Priority 3: Both approvals done - show confirm
-                        elif order.credit_override_approved and order.overdue_check_approved:
-                            show_confirm = True
-
-                    # Case D: No issues OR all approvals done - show confirm
-                    elif ((not order.credit_exceeded or order.credit_override_approved) and
-                          (not order.has_overdue or order.overdue_check_approved)):
-                        show_confirm = True
+            # Step 1: Show Check Credit button when order is ready but credit not checked
+            show_check_credit = bool(
+                order.approval_state == 'to_check' and
+                order.partner_id and order.product_category_id and order.order_line
+            )
+
+            # Step 2: After credit check - only the expected approver sees the next action
+            show_credit_override = order.approval_state == 'sales_approval' and is_sales_person
+            show_overdue_check = order.approval_state == 'accounting_approval' and is_accounting_person
+
+            # No issues OR all approvals done - show confirm
+            show_confirm = order.approval_state == 'approved'
 
             # Set the computed values
             order.show_check_credit_button = show_check_credit
@@ -244,14 +271,15 @@ class SaleOrder(models.Model):
         if not self.order_line:
             raise ValidationError("Please add at least one product line.")
 
-        # Compute credit info
-        self._compute_credit_info()
+        # Bring the ledger up to date, the stored credit info follows its version
+        exposure_state = self.env['res.partner.credit.exposure']._read_exposure(
+            [(self.partner_id.id, self.product_category_id.id)]
+        )
 
         # Check credit line exists
-        credit_line = self.env['res.partner.credit.line'].search([
-            ('partner_id', '=', self.partner_id.id),
-            ('product_category_id', '=', self.product_category_id.id)
-        ], limit=1)
+        credit_line = self.env['res.partner.credit.line']._get_credit_line(
+            self.partner_id.id, self.product_category_id.id
+        )
 
         if not credit_line:
             raise ValidationError(
@@ -273,53 +301,17 @@ class SaleOrder(models.Model):
         else:
             self.credit_exceeded = False
 
+        # Remember what the check was made against so confirmation can skip it
+        self.credit_check_fingerprint = self._get_credit_fingerprint(exposure_state)
+
         # Calculate overdue amount
-        today = fields.Date.today()
-        all_overdue_invoices = self.env['account.move'].search([
-            ('partner_id', '=', self.partner_id.id),
-            ('move_type', '=', 'out_invoice'),
-            ('state', '=', 'posted'),
-            ('amount_residual', '>', 0),
-            ('invoice_date_due', '!=', False),
-            ('invoice_date_due', '<', today)
-        ])
-
-        total_overdue_amount = sum(all_overdue_invoices.mapped('amount_residual'))
+        aging = self.env['res.partner']._get_overdue_aging(self.partner_id.ids)
+        total_overdue_amount = aging[self.partner_id.id]['total']
         self.customer_overdue_amount = total_overdue_amount
 
-        # Initialize has_overdue
-        self.has_overdue = False
-
         # Check overdue logic ONLY for business units with FERTILIZER or SND
-        if total_overdue_amount > 0 and self.business_unit:
-            business_unit_name = self.business_unit.name.upper()
-
-            # Only apply checkbox logic for FERTILISER/FERTILIZER and SND
-            if 'FERTILISER' in business_unit_name or 'FERTILIZER' in business_unit_name or 'SND' in business_unit_name:
-                # Try to get the checkbox value
-                try:
-                    checkbox_value = self.business_unit.override_credit_days
-
-                    if checkbox_value:
-                        # CHECKED = Need accounting approval
-                        self.has_overdue = True
-                        # message = f"Override Credit Days CHECKED on '{self.business_unit.name}' - Accounting approval REQUIRED"
-                        message = "Override period exiciding period days - Accounting approval REQUIRED"
-                    else:
-                        # UNCHECKED = Bypass accounting approval
-                        self.has_overdue = False
-                        message = f"Override Credit Days UNCHECKED on '{self.business_unit.name}' - Accounting approval BYPASSED"
-
-                except AttributeError:
-                    # Field doesn't exist - default behavior
-                    self.has_overdue = True
-                    message = f"Override Credit Days field not found - Accounting approval required by default"
-            else:
-                # Other business units - always require approval if overdue
-                self.has_overdue = True
-                message = f"Business unit '{self.business_unit.name}' - Accounting approval required"
-        else:
-            message = "No overdue amount found"
+        has_overdue, message = self._get_overdue_decision(total_overdue_amount)
+        self.has_overdue = has_overdue
 
         # Build status message
         credit_text = f"Credit Limit: {'Unlimited' if self.assigned_limit == float('inf') else f'₹{self.assigned_limit:,.2f}'}"
@@ -693,70 +685,221 @@ class SaleOrder(models.Model):
     #             }
     #         }
 
-    def action_approve_credit_override(self):
-        """Sales person approves credit limit override"""
+    def _get_overdue_decision(self, total_overdue_amount):
+        """Return (has_overdue, message) for the business unit of this order"""
         self.ensure_one()
+        has_overdue = False
+
+        # Check overdue logic ONLY for business units with FERTILIZER or SND
+        if total_overdue_amount > 0 and self.business_unit:
+            business_unit_name = self.business_unit.name.upper()
+
+            # Only apply checkbox logic for FERTILISER/FERTILIZER and SND
+            if 'FERTILISER' in business_unit_name or 'FERTILIZER' in business_unit_name or 'SND' in business_unit_name:
+                # Try to get the checkbox value
+                try:
+                    checkbox_value = self.business_unit.override_credit_days
+
+                    if checkbox_value:
+                        # CHECKED = Need accounting approval
+                        has_overdue = True
+                        # message = f"Override Credit Days CHECKED on '{self.business_unit.name}' - Accounting approval REQUIRED"
+                        message = "Override period exiciding period days - Accounting approval REQUIRED"
+                    else:
+                        # UNCHECKED = Bypass accounting approval
+                        has_overdue = False
+                        message = f"Override Credit Days UNCHECKED on '{self.business_unit.name}' - Accounting approval BYPASSED"
+
+                except AttributeError:
+                    # Field doesn't exist - default behavior
+                    has_overdue = True
+                    message = f"Override Credit Days field not found - Accounting approval required by default"
+            else:
+                # Other business units - always require approval if overdue
+                has_overdue = True
+                message = f"Business unit '{self.business_unit.name}' - Accounting approval required"
+        else:
+            message = "No overdue amount found"
+
+        return has_overdue, message
+
+    def action_check_credit_limit_batch(self):
+        """Check credit limit and overdue amount of many orders in one pass"""
+        orders = self.filtered(lambda o: o.state == 'draft')
+        skipped = self - orders
+
+        # Load credit lines, exposure and aging once for every involved pair
+        lines_by_pair = self.env['res.partner.credit.line']._get_credit_lines(
+            {(order.partner_id.id, order.product_category_id.id) for order in orders}
+        )
+        exposure_state = self.env['res.partner.credit.exposure']._read_exposure(lines_by_pair)
+        aging = self.env['res.partner']._get_overdue_aging(orders.partner_id.ids)
+
+        # Group orders by their resulting flags so they are written together
+        updates = defaultdict(list)
+        fingerprints = {}
+        missing_credit_lines = []
+        exceeded_count = overdue_count = passed_count = 0
+        for order in orders:
+            pair = (order.partner_id.id, order.product_category_id.id)
+            credit_line = lines_by_pair.get(pair)
+            if not order.order_line or not credit_line:
+                missing_credit_lines.append(order.name)
+                continue
+
+            limit_remaining = float('inf')
+            if not credit_line.is_infinite_credit:
+                limit_remaining = credit_line.credit_limit - exposure_state.get(pair, (0.0, 0))[0]
+            credit_exceeded = limit_remaining != float('inf') and limit_remaining < order.amount_total
+
+            has_overdue = order._get_overdue_decision(aging[order.partner_id.id]['total'])[0]
+
+            updates[(credit_exceeded, has_overdue)].append(order.id)
+            fingerprints[order.id] = order._get_credit_fingerprint(exposure_state)
+            if credit_exceeded:
+                exceeded_count += 1
+            if has_overdue:
+                overdue_count += 1
+            if not credit_exceeded and not has_overdue:
+                passed_count += 1
+
+        for (credit_exceeded, has_overdue), order_ids in updates.items():
+            self.browse(order_ids).write({
+                'credit_checked': True,
+                'credit_exceeded': credit_exceeded,
+                'has_overdue': has_overdue,
+                'credit_override_requested': False,
+                'credit_override_approved': False,
+                'overdue_check_requested': False,
+                'overdue_check_approved': False,
+            })
+
+        # Every fingerprint differs, set them all with one UPDATE instead of a write per order
+        if fingerprints:
+            self.flush_model(['credit_check_fingerprint'])
+            self.env.cr.execute("""
+                UPDATE sale_order so
+                   SET credit_check_fingerprint = f.fingerprint
+                  FROM unnest(%s::int[], %s::varchar[]) AS f(order_id, fingerprint)
+                 WHERE so.id = f.order_id
+            """, [list(fingerprints), list(fingerprints.values())])
+            self.browse(fingerprints).invalidate_recordset(['credit_check_fingerprint'])
+
+        # Build one summary instead of a notification per order
+        checked_count = sum(len(order_ids) for order_ids in updates.values())
+        summary_lines = [
+            f"Orders checked: {checked_count}",
+            f"Ready to confirm: {passed_count}",
+            f"Credit limit exceeded - Sales approval required: {exceeded_count}",
+            f"Overdue amount - Accounting approval required: {overdue_count}",
+        ]
+        if missing_credit_lines:
+            summary_lines.append(
+                f"Skipped (no credit limit or no product line): {', '.join(missing_credit_lines)}"
+            )
+        if skipped:
+            summary_lines.append(f"Skipped (not in quotation state): {', '.join(skipped.mapped('name'))}")
+
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Credit Check Completed',
+                'message': "\n".join(summary_lines),
+                'type': 'warning' if (exceeded_count or overdue_count or missing_credit_lines) else 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            }
+        }
 
+    def action_approve_credit_override(self):
+        """Sales person approves credit limit override, for every selected order at once"""
         # Check if user has sales person credit rights
         if not self.env.user.is_sales_person_credit:
             raise ValidationError("Only sales persons with credit rights can override credit limits.")
 
-        if not self.credit_exceeded:
+        orders = self.filtered(lambda o: o.credit_exceeded and not o.credit_override_approved)
+        if not orders:
             raise ValidationError("Credit override is only available when credit limit is exceeded.")
 
         # Mark as override approved
-        self.credit_override_approved = True
+        orders.write({'credit_override_approved': True})
 
         # Post message to chatter
         sales_person = self.env.user.name
-        self.message_post(
-            body=f"✅ Credit limit overridden by Sales Person: {sales_person}",
-            message_type='notification',
-            subtype_xmlid='mail.mt_note'
+        orders._message_log_batch(bodies={
+            order.id: f"✅ Credit limit overridden by Sales Person: {sales_person}"
+            for order in orders
+        })
+
+        return self._get_approval_notification(
+            'Credit Override Approved',
+            f'✅ Credit limit overridden by {sales_person} on {len(orders)} order(s)',
+            orders,
         )
 
-        return {
-            'type': 'ir.actions.client',
-            'tag': 'reload',
-            'params': {
-                'title': 'Credit Override Approved',
-                'message': f'✅ Credit limit overridden by {sales_person}',
-                'type': 'success',
-            }
-        }
-
     def action_approve_overdue_check(self):
-        """Accounting person approves overdue check"""
-        self.ensure_one()
-
+        """Accounting person approves overdue check, for every selected order at once"""
         # Check if user has accounting person credit rights
         if not self.env.user.is_accounting_person_credit:
             raise ValidationError("Only accounting persons can approve overdue checks.")
 
-        if not self.has_overdue:
+        orders = self.filtered(lambda o: o.has_overdue and not o.overdue_check_approved)
+        if not orders:
             raise ValidationError("Overdue check is only available when customer has overdue amount.")
 
         # Mark as overdue check approved
-        self.overdue_check_approved = True
+        orders.write({'overdue_check_approved': True})
 
         # Post message to chatter
         accounting_person = self.env.user.name
-        self.message_post(
-            body=f"✅ Overdue amount approved by Accounting Person: {accounting_person}. Overdue Amount: ₹{self.customer_overdue_amount:,.2f}",
-            message_type='notification',
-            subtype_xmlid='mail.mt_note'
+        orders._message_log_batch(bodies={
+            order.id: f"✅ Overdue amount approved by Accounting Person: {accounting_person}. "
+                      f"Overdue Amount: ₹{order.customer_overdue_amount:,.2f}"
+            for order in orders
+        })
+
+        return self._get_approval_notification(
+            'Overdue Check Approved',
+            f'✅ Overdue amount approved by {accounting_person} on {len(orders)} order(s)',
+            orders,
         )
 
+    def _get_approval_notification(self, title, message, approved):
+        """One summary notification for a bulk approval, listing the orders left out"""
+        skipped = self - approved
+        if skipped:
+            message += f"\nSkipped (nothing to approve): {', '.join(skipped.mapped('name'))}"
+
         return {
             'type': 'ir.actions.client',
-            'tag': 'reload',
+            'tag': 'display_notification',
             'params': {
-                'title': 'Overdue Check Approved',
-                'message': f'✅ Overdue amount approved by {accounting_person}',
-                'type': 'success',
+                'title': title,
+                'message': message,
+                'type': 'warning' if skipped else 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
             }
         }
 
+    @api.model
+    def action_open_my_approval_queue(self):
+        """Quotations waiting for the approvals the current user can give"""
+        states = []
+        if self.env.user.is_sales_person_credit:
+            states.append('sales_approval')
+        if self.env.user.is_accounting_person_credit:
+            states.append('accounting_approval')
+
+        action = self.env['ir.actions.act_window']._for_xml_id('sale.action_quotations_with_onboarding')
+        action.update({
+            'name': 'Awaiting My Approval',
+            'domain': [('approval_state', 'in', states)],
+            'context': {'create': False},
+        })
+        return action
+
     def update_button_visibility(self):
         """Public method to force refresh button visibility - can be called from button"""
         self._compute_button_visibility()
@@ -814,12 +957,12 @@ class SaleOrder(models.Model):
         self.credit_override_approved = False
         self.overdue_check_approved = False
 
+        # Keep the lines of the category being left in the form itself
+        self.env['sale.order.line.stash']._snapshot_lines(self)
+
         if self.product_category_id:
-            self._save_current_lines()
-            self.order_line = [(5, 0, 0)]
             self._load_saved_lines()
-            self._compute_credit_info()
-            self._compute_credit_info_visible()
+            # Credit info follows product_category_id on its own, from the stored exposure ledger
             self._auto_fill_payment_terms()
 
     def _auto_fill_payment_terms(self):
@@ -827,22 +970,36 @@ class SaleOrder(models.Model):
         if not self.product_category_id or not self.partner_id:
             return
 
-        customer_state = None
-        if self.partner_id.state_id:
-            customer_state = self.partner_id.state_id
-        elif self.partner_id.parent_id and self.partner_id.parent_id.state_id:
-            customer_state = self.partner_id.parent_id.state_id
-
-        if not customer_state:
-            return
+        payment_term_id = self._resolve_credit_payment_terms(
+            [(self.partner_id.id, self.product_category_id.id)]
+        ).get((self.partner_id.id, self.product_category_id.id))
 
-        credit_period = self.env['credit.period'].search([
-            ('category_id', '=', self.product_category_id.id),
-            ('state_id', '=', customer_state.id)
-        ], limit=1)
+        if payment_term_id:
+            self.payment_term_id = payment_term_id
 
-        if credit_period and credit_period.credit_days:
-            self.payment_term_id = credit_period.credit_days
+    @api.model
+    def _resolve_credit_payment_terms(self, pairs):
+        """Return {(partner_id, category_id): payment_term_id} from the cached credit period matrix.
+
+        The customer's state, or its parent's, selects the credit period.
+        """
+        pairs = {(partner_id, category_id) for partner_id, category_id in pairs if partner_id and category_id}
+        if not pairs:
+            return {}
+
+        partners = self.env['res.partner'].browse({partner_id for partner_id, category_id in pairs})
+        state_by_partner = {
+            partner.id: (partner.state_id or partner.parent_id.state_id).id
+            for partner in partners
+        }
+        terms = self.env['credit.period']._get_payment_terms(
+            {(category_id, state_by_partner[partner_id]) for partner_id, category_id in pairs}
+        )
+        return {
+            (partner_id, category_id): terms[(category_id, state_by_partner[partner_id])]
+            for partner_id, category_id in pairs
+            if (category_id, state_by_partner[partner_id]) in terms
+        }
 
     @api.onchange('order_line')
     def _onchange_order_line(self):
@@ -854,82 +1011,94 @@ class SaleOrder(models.Model):
 
     def _save_current_lines(self):
         """Save current order lines to storage"""
-        if not self.order_line:
-            return
-
-        lines_data = []
-        for line in self.order_line:
-            if line.product_id:
-                line_data = {
-                    'product_id': line.product_id.id,
-                    'qty': line.product_uom_qty,
-                    'price': line.price_unit,
-                    'name': line.name
-                }
-                lines_data.append(line_data)
-
-        if lines_data:
-            first_product = self.order_line[0].product_id
-            if first_product and first_product.categ_id:
-                category_name = first_product.categ_id.name.upper()
-                if 'SND' in category_name:
-                    self.snd_products_json = json.dumps(lines_data)
-                elif 'FERTILIZER' in category_name:
-                    self.fertilizer_products_json = json.dumps(lines_data)
+        self.env['sale.order.line.stash']._save_lines(self)
 
     def _load_saved_lines(self):
-        """Load saved lines for selected category"""
+        """Load saved lines for selected category, as a diff of the current lines"""
         if not self.product_category_id:
             return
 
-        category_name = self.product_category_id.name.upper()
-        stored_data = None
-
-        try:
-            if 'SND' in category_name and self.snd_products_json:
-                stored_data = json.loads(self.snd_products_json)
-            elif 'FERTILIZER' in category_name and self.fertilizer_products_json:
-                stored_data = json.loads(self.fertilizer_products_json)
-        except:
-            stored_data = None
-
-        if stored_data:
-            new_lines = []
-            for line_data in stored_data:
-                vals = {
-                    'product_id': line_data.get('product_id'),
-                    'product_uom_qty': line_data.get('qty', 1.0),
-                    'price_unit': line_data.get('price', 0.0),
-                    'name': line_data.get('name', '')
-                }
-                new_lines.append((0, 0, vals))
-            if new_lines:
-                self.order_line = new_lines
+        stored_data = self.env['sale.order.line.stash']._get_stashed_lines(self, self.product_category_id)
+        stored_by_product = defaultdict(list)
+        for line_data in stored_data:
+            stored_by_product[line_data['product_id']].append(line_data)
+
+        # Products still sold under the new category, in one query
+        product_lines = self.order_line.filtered('product_id')
+        valid_product_ids = set(self.env['product.product'].search([
+            ('id', 'in', product_lines.product_id.ids),
+            ('categ_id', 'child_of', self.product_category_id.id),
+        ]).ids) if product_lines else set()
+
+        # Lines of a stashed product are updated, other valid lines are kept untouched,
+        # only the lines that do not belong to the new category go away
+        commands = []
+        restored = set()
+        for line in self.order_line:
+            # Sections and notes belong to no category
+            if line.display_type:
+                continue
+            if not stored_by_product.get(line.product_id.id):
+                if line.product_id.id not in valid_product_ids:
+                    commands.append(Command.delete(line.id))
+                continue
+            line_data = stored_by_product[line.product_id.id].pop(0)
+            restored.add(id(line_data))
+            vals = {
+                fname: value for fname, value in line_data.items()
+                if fname != 'product_id' and line[fname] != value
+            }
+            if vals:
+                commands.append(Command.update(line.id, vals))
+
+        # Only the stashed lines missing from the order are created
+        commands += [Command.create(line_data) for line_data in stored_data if id(line_data) not in restored]
+        if commands:
+            self.order_line = commands
+
+    @api.depends('partner_id', 'product_category_id', 'state')
+    def _compute_credit_line_id(self):
+        """Resolve the credit line of every quotation in one pass"""
+        quotations = self.filtered(lambda o: o.state in ('draft', 'sent'))
+        lines_by_pair = self.env['res.partner.credit.line']._get_credit_lines(
+            {(order.partner_id.id, order.product_category_id.id) for order in quotations}
+        )
+        for order in self:
+            order.credit_line_id = (
+                order in quotations and
+                lines_by_pair.get((order.partner_id.id, order.product_category_id.id), False)
+            )
 
-    @api.depends('partner_id', 'product_category_id', 'state', 'amount_total')
+    @api.depends('partner_id', 'product_category_id', 'state', 'credit_line_id.credit_limit',
+                 'credit_line_id.is_infinite_credit', 'credit_line_id.exposure_version')
     def _compute_credit_info(self):
-        """Compute credit info - STEP BY STEP"""
+        """Compute credit info once per credit line for the whole recordset.
+
+        Only quotations have a credit_line_id, so only they follow the
+        exposure_version of their line. Other orders are recomputed when their
+        own customer, category or state changes, and keep the figures of that
+        moment (e.g. their confirmation) afterwards.
+        """
+        lines_by_pair = self.env['res.partner.credit.line']._get_credit_lines(
+            {(order.partner_id.id, order.product_category_id.id) for order in self}
+        )
+        usage = self.env['res.partner.credit.exposure']._get_exposure(list(lines_by_pair), refresh=False)
+
         for order in self:
             assigned_limit = 0.0
             limit_used = 0.0
             limit_remaining = 0.0
 
-            if order.partner_id and order.product_category_id:
-                credit_line = self.env['res.partner.credit.line'].search([
-                    ('partner_id', '=', order.partner_id.id),
-                    ('product_category_id', '=', order.product_category_id.id)
-                ], limit=1)
-
-                if credit_line:
-                    credit_line._compute_credit_usage()
-                    if credit_line.is_infinite_credit:
-                        assigned_limit = float('inf')
-                        limit_used = credit_line.credit_used
-                        limit_remaining = float('inf')
-                    else:
-                        assigned_limit = credit_line.credit_limit
-                        limit_used = credit_line.credit_used
-                        limit_remaining = credit_line.credit_remaining
+            pair = (order.partner_id.id, order.product_category_id.id)
+            credit_line = lines_by_pair.get(pair)
+            if credit_line:
+                limit_used = usage.get(pair, 0.0)
+                if credit_line.is_infinite_credit:
+                    assigned_limit = float('inf')
+                    limit_remaining = float('inf')
+                else:
+                    assigned_limit = credit_line.credit_limit
+                    limit_remaining = credit_line.credit_limit - limit_used
 
             order.assigned_limit = assigned_limit
             order.limit_used = limit_used
@@ -965,24 +1134,45 @@ class SaleOrder(models.Model):
                     "\n\nPlease update the customer's license information before saving the sales order."
                 )
 
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         """Check license when creating sales order"""
-        # Check license only
-        if 'partner_id' in vals:
-            partner = self.env['res.partner'].browse(vals['partner_id'])
+        # Check license only, once per customer
+        for partner in self.env['res.partner'].browse({vals['partner_id'] for vals in vals_list if vals.get('partner_id')}):
             self._check_customer_license(partner)
 
-        return super(SaleOrder, self).create(vals)
+        # Payment terms of the credit period, resolved for the whole batch
+        missing_terms = [vals for vals in vals_list if not vals.get('payment_term_id')]
+        if missing_terms:
+            terms = self._resolve_credit_payment_terms(
+                [(vals.get('partner_id'), vals.get('product_category_id')) for vals in missing_terms]
+            )
+            for vals in missing_terms:
+                payment_term_id = terms.get((vals.get('partner_id'), vals.get('product_category_id')))
+                if payment_term_id:
+                    vals['payment_term_id'] = payment_term_id
+
+        snapshots = [vals.pop('line_stash_snapshot', None) for vals in vals_list]
+        orders = super(SaleOrder, self).create(vals_list)
+
+        # Stash the lines of the new orders, and those the form kept for other categories
+        orders._save_current_lines()
+        for order, snapshot in zip(orders, snapshots):
+            if snapshot:
+                self.env['sale.order.line.stash']._save_snapshot(order, snapshot)
+        return orders
 
     def write(self, vals):
         """Save lines when order is saved and check license validation"""
+        snapshot = vals.pop('line_stash_snapshot', None)
+
         # Reset checks if critical fields change
         if any(field in vals for field in ['partner_id', 'product_category_id', 'order_line']):
             vals.update({
                 'credit_checked': False,
                 'credit_override_approved': False,
                 'overdue_check_approved': False,
+                'credit_check_fingerprint': False,
             })
 
         # Check license fields before saving
@@ -992,74 +1182,162 @@ class SaleOrder(models.Model):
                     vals.get('partner_id')) if 'partner_id' in vals else order.partner_id
                 self._check_customer_license(partner)
 
+        # Stash the lines of the category being left before they are replaced
+        if 'product_category_id' in vals:
+            self._save_current_lines()
+
+        # Confirmed orders being edited move their exposure with them
+        if any(field in vals for field in ['partner_id', 'product_category_id', 'order_line']):
+            self.env['res.partner.credit.event']._track_orders(
+                self.filtered(lambda o: o.state in ('sale', 'done'))
+            )
+
         result = super(SaleOrder, self).write(vals)
 
         # Save lines after write
-        for order in self:
-            if 'order_line' in vals:
-                order._save_current_lines()
+        if 'order_line' in vals:
+            self._save_current_lines()
+        if snapshot:
+            for order in self:
+                self.env['sale.order.line.stash']._save_snapshot(order, snapshot)
 
         return result
 
-    def action_confirm(self):
-        """When order is confirmed - check all validations"""
-        # Check if credit has been verified
-        if not self.credit_checked:
-            raise ValidationError("Please check credit limit before confirming the order.")
+    def _get_credit_fingerprint(self, exposure_state):
+        """Fingerprint of a credit check, exposure_state coming from _read_exposure()"""
+        self.ensure_one()
+        pair = (self.partner_id.id, self.product_category_id.id)
+        version = exposure_state.get(pair, (0.0, 0))[1]
+        amount = float_repr(self.amount_total, self.currency_id.decimal_places)
+        return f"{pair[0]}:{pair[1]}:{amount}:{version}"
+
+    def _get_orders_over_cumulative_limit(self):
+        """Orders that no longer fit once the earlier orders of the same
+        (partner, category) have consumed the remaining limit"""
+        if not self:
+            return self
+
+        lines_by_pair = self.env['res.partner.credit.line']._get_credit_lines(
+            {(order.partner_id.id, order.product_category_id.id) for order in self}
+        )
+        exposure = self.env['res.partner.credit.exposure']._get_exposure(lines_by_pair)
 
-        # Check credit limit approval
-        if self.credit_exceeded and not self.credit_override_approved:
-            raise ValidationError("Credit limit exceeded. Sales person approval required before confirmation.")
+        remaining = {}
+        for pair, credit_line in lines_by_pair.items():
+            if credit_line.is_infinite_credit:
+                remaining[pair] = float('inf')
+            else:
+                remaining[pair] = credit_line.credit_limit - exposure.get(pair, 0.0)
 
-        # Check overdue approval
-        if self.has_overdue and not self.overdue_check_approved:
-            raise ValidationError(
-                "Customer has overdue amount. Accounting person approval required before confirmation.")
+        rejected_ids = []
+        for order in self.sorted(lambda o: (o.date_order, o.id)):
+            pair = (order.partner_id.id, order.product_category_id.id)
+            if pair not in remaining:
+                continue
 
-        # Check license before confirming
-        self._check_customer_license(self.partner_id)
+            # Approved overrides always go through but still consume the limit
+            if not order.credit_override_approved and remaining[pair] < order.amount_total:
+                rejected_ids.append(order.id)
+                continue
 
-        result = super(SaleOrder, self).action_confirm()
+            remaining[pair] -= order.amount_total
 
-        # Post confirmation message
-        confirmation_msg = "✅ Order confirmed"
-        if self.credit_exceeded and self.credit_override_approved:
-            confirmation_msg += " with credit override approval"
-        if self.has_overdue and self.overdue_check_approved:
-            confirmation_msg += " with overdue approval"
-        confirmation_msg += "."
+        return self.browse(rejected_ids)
 
-        self.message_post(
-            body=confirmation_msg,
-            message_type='notification',
-            subtype_xmlid='mail.mt_note'
+    def action_confirm(self):
+        """When orders are confirmed - check all validations"""
+        for order in self:
+            # Check if credit has been verified
+            if not order.credit_checked:
+                raise ValidationError(f"Please check credit limit before confirming the order {order.name}.")
+
+            # Check credit limit approval
+            if order.credit_exceeded and not order.credit_override_approved:
+                raise ValidationError(
+                    f"Credit limit exceeded on {order.name}. Sales person approval required before confirmation.")
+
+            # Check overdue approval
+            if order.has_overdue and not order.overdue_check_approved:
+                raise ValidationError(
+                    f"Customer of {order.name} has overdue amount. "
+                    f"Accounting person approval required before confirmation.")
+
+        # Check license before confirming
+        for partner in self.partner_id:
+            self._check_customer_license(partner)
+
+        # Serialize concurrent confirmations of the same customer and category
+        exposure = self.env['res.partner.credit.exposure']
+        pairs = [(order.partner_id.id, order.product_category_id.id) for order in self]
+        exposure._lock_exposure(pairs)
+
+        # An order alone on its pair whose check still matches the ledger needs no recheck
+        exposure_state = exposure._read_exposure(pairs)
+        pair_counts = Counter(pairs)
+        to_recheck = self.filtered(
+            lambda o: pair_counts[(o.partner_id.id, o.product_category_id.id)] > 1
+            or o.credit_check_fingerprint != o._get_credit_fingerprint(exposure_state)
         )
 
-        # Force refresh credit to show deduction immediately
-        if self.partner_id and self.product_category_id:
-            credit_line = self.env['res.partner.credit.line'].search([
-                ('partner_id', '=', self.partner_id.id),
-                ('product_category_id', '=', self.product_category_id.id)
-            ], limit=1)
-            if credit_line:
-                credit_line.force_refresh_credit()
+        # Orders that each fit alone may not fit together
+        rejected = to_recheck._get_orders_over_cumulative_limit()
+        if rejected and rejected == self:
+            raise ValidationError(
+                "Credit limit exceeded once the other confirmed orders are taken into account: "
+                f"{', '.join(rejected.mapped('name'))}. Please check credit limit again."
+            )
+        orders = self - rejected
+
+        # The credit consumed by the confirmation reaches the exposure ledger once for all orders
+        self.env['res.partner.credit.event']._track_orders(orders)
+
+        result = super(SaleOrder, orders).action_confirm()
+
+        # Post confirmation messages in bulk
+        bodies = {}
+        for order in orders:
+            confirmation_msg = "✅ Order confirmed"
+            if order.credit_exceeded and order.credit_override_approved:
+                confirmation_msg += " with credit override approval"
+            if order.has_overdue and order.overdue_check_approved:
+                confirmation_msg += " with overdue approval"
+            confirmation_msg += "."
+            bodies[order.id] = confirmation_msg
+        orders._message_log_batch(bodies=bodies)
+
+        if rejected:
+            # Send the orders that no longer fit back to the approval flow
+            rejected.write({'credit_exceeded': True, 'credit_override_approved': False})
+            rejected._message_log_batch(bodies={
+                order.id: "⚠️ Not confirmed: credit limit exceeded together with the other orders of this batch."
+                for order in rejected
+            })
+
+            # Tell whoever confirmed the batch, the chatter alone goes unnoticed
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': 'Some Orders Were Not Confirmed',
+                    'message': "\n".join([
+                        f"Confirmed: {len(orders)}",
+                        f"Credit limit exceeded together with the other orders - Sales approval required: "
+                        f"{', '.join(rejected.mapped('name'))}",
+                    ]),
+                    'type': 'warning',
+                    'sticky': True,
+                    'next': result if isinstance(result, dict) else {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+                }
+            }
 
         return result
 
     def action_cancel(self):
         """When order is cancelled - credit should be restored"""
-        result = super(SaleOrder, self).action_cancel()
-
-        # Force refresh credit to show restoration
-        if self.partner_id and self.product_category_id:
-            credit_line = self.env['res.partner.credit.line'].search([
-                ('partner_id', '=', self.partner_id.id),
-                ('product_category_id', '=', self.product_category_id.id)
-            ], limit=1)
-            if credit_line:
-                credit_line.force_refresh_credit()
+        # Give the released credit back to the exposure ledger
+        self.env['res.partner.credit.event']._track_orders(self)
 
-        return result
+        return super(SaleOrder, self).action_cancel()
 
 
 class SaleOrderLine(models.Model):
@@ -1127,186 +1405,150 @@ class AccountMove(models.Model):
         store=True
     )
 
-    @api.model_create_multi
-    def create(self, vals_list):
-        records = super(AccountMove, self).create(vals_list)
+    is_open_receivable = fields.Boolean(
+        string='Open Receivable',
+        compute='_compute_is_open_receivable',
+        store=True,
+        help='Posted customer invoice that still has an amount to collect'
+    )
 
-        # Auto-populate product category from sales order
-        for result in records:
-            if result.move_type == 'out_invoice' and result.invoice_origin:
-                sale_order = self.env['sale.order'].search([
-                    ('name', '=', result.invoice_origin)
-                ], limit=1)
-                if sale_order and hasattr(sale_order, 'product_category_id') and sale_order.product_category_id:
-                    result.product_category_id = sale_order.product_category_id.id
+    def _auto_init(self):
+        # Fill the new column in SQL instead of recomputing every move on install
+        if not column_exists(self.env.cr, 'account_move', 'is_open_receivable'):
+            create_column(self.env.cr, 'account_move', 'is_open_receivable', 'boolean')
+            self.env.cr.execute("""
+                UPDATE account_move
+                   SET is_open_receivable = (move_type = 'out_invoice'
+                                             AND state = 'posted'
+                                             AND amount_residual > 0)
+            """)
+        return super(AccountMove, self)._auto_init()
+
+    def init(self):
+        super(AccountMove, self).init()
+        # Overdue and credit scans only ever look at open customer invoices
+        create_index(
+            self.env.cr,
+            'account_move_open_receivable_partner_due_idx',
+            'account_move',
+            ['partner_id', 'invoice_date_due'],
+            where='is_open_receivable',
+        )
 
-                    # # Auto-fill payment terms from sale order
-                    # if sale_order and sale_order.payment_term_id:
-                    #     result.property_payment_term_id = sale_order.payment_term_id.id
+    @api.depends('move_type', 'state', 'amount_residual')
+    def _compute_is_open_receivable(self):
+        for move in self:
+            move.is_open_receivable = (
+                move.move_type == 'out_invoice' and
+                move.state == 'posted' and
+                move.amount_residual > 0
+            )
 
-        return records
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Auto-populate product category from sales order, before the invoices exist
+        vals_list = self._prepare_product_category_vals(vals_list)
+        return super(AccountMove, self).create(vals_list)
+
+    @api.model
+    def _prepare_product_category_vals(self, vals_list):
+        """Resolve product_category_id of every new customer invoice with one grouped lookup.
+
+        The sale_line_ids of the invoice lines are used first, then the
+        (possibly comma-separated) order names of invoice_origin.
+        """
+        default_move_type = self.env.context.get('default_move_type')
+        sale_line_ids_by_index = {}
+        origins_by_index = {}
+        for index, vals in enumerate(vals_list):
+            if vals.get('product_category_id') or vals.get('move_type', default_move_type) != 'out_invoice':
+                continue
+
+            sale_line_ids = []
+            for command in [*vals.get('invoice_line_ids', []), *vals.get('line_ids', [])]:
+                if command[0] != Command.CREATE:
+                    continue
+                for sale_line_command in command[2].get('sale_line_ids', []):
+                    if sale_line_command[0] == Command.LINK:
+                        sale_line_ids.append(sale_line_command[1])
+                    elif sale_line_command[0] == Command.SET:
+                        sale_line_ids.extend(sale_line_command[2])
+            if sale_line_ids:
+                sale_line_ids_by_index[index] = sale_line_ids
+            elif vals.get('invoice_origin'):
+                origins_by_index[index] = [name.strip() for name in vals['invoice_origin'].split(',') if name.strip()]
+
+        if not sale_line_ids_by_index and not origins_by_index:
+            return vals_list
+
+        # One read of the linked order lines, one search of the origin names
+        sale_lines = self.env['sale.order.line'].browse(
+            {line_id for line_ids in sale_line_ids_by_index.values() for line_id in line_ids}
+        )
+        category_by_sale_line = {line.id: line.order_id.product_category_id.id for line in sale_lines}
+        order_names = {name for names in origins_by_index.values() for name in names}
+        category_by_order_name = {
+            order['name']: order['product_category_id'][0]
+            for order in self.env['sale.order'].search_read(
+                [('name', 'in', list(order_names)), ('product_category_id', '!=', False)],
+                ['name', 'product_category_id']
+            )
+        } if order_names else {}
+
+        vals_list = [dict(vals) for vals in vals_list]
+        for index, sale_line_ids in sale_line_ids_by_index.items():
+            category_id = next(filter(None, map(category_by_sale_line.get, sale_line_ids)), False)
+            if category_id:
+                vals_list[index]['product_category_id'] = category_id
+        for index, names in origins_by_index.items():
+            category_id = next(filter(None, map(category_by_order_name.get, names)), False)
+            if category_id:
+                vals_list[index]['product_category_id'] = category_id
+
+        return vals_list
+
+    def _get_credit_orders(self):
+        """Sale orders whose credit exposure depends on these customer invoices"""
+        invoices = self.filtered(lambda m: m.move_type == 'out_invoice')
+        return invoices.line_ids.sale_line_ids.order_id
+
+    def _get_overdue_customers(self):
+        """Customers whose overdue status depends on these moves"""
+        invoices = self.filtered(lambda m: m.move_type == 'out_invoice')
+        return invoices.partner_id.filtered('customer_rank')
 
     def action_post(self):
         """STEP 2: When invoice is posted - credit calculation switches to invoice-based"""
+        events = self.env['res.partner.credit.event']
+        events._track_orders(self._get_credit_orders())
+
         result = super(AccountMove, self).action_post()
 
-        for invoice in self:
-            if invoice.move_type == 'out_invoice' and invoice.partner_id:
-                if invoice.invoice_origin:
-                    sale_order = self.env['sale.order'].search([
-                        ('name', '=', invoice.invoice_origin)
-                    ], limit=1)
-                    if sale_order and sale_order.product_category_id:
-                        credit_line = self.env['res.partner.credit.line'].search([
-                            ('partner_id', '=', invoice.partner_id.id),
-                            ('product_category_id', '=', sale_order.product_category_id.id)
-                        ], limit=1)
-                        if credit_line:
-                            credit_line.force_refresh_credit()
+        events._add_overdue_partners(self._get_overdue_customers())
 
         return result
 
     def write(self, vals):
-        """STEP 3: When invoice amount_residual changes (due to payment) - refresh credit"""
-        old_residuals = {}
-        if any(field in vals for field in ['amount_residual', 'payment_state']):
-            for invoice in self:
-                if invoice.move_type == 'out_invoice':
-                    old_residuals[invoice.id] = invoice.amount_residual
+        """STEP 3: When invoice state changes - refresh credit.
+
+        Residual changes never come through here: amount_residual and
+        payment_state are stored computes, the partial reconcile hooks below
+        follow them.
+        """
+        events = self.env['res.partner.credit.event']
+        if 'state' in vals:
+            # Posting (cron included), resetting to draft or cancelling: the invoices
+            # start or stop counting, measure their orders again
+            events._track_orders(self._get_credit_orders())
 
         result = super(AccountMove, self).write(vals)
 
-        if old_residuals:
-            for invoice in self:
-                if (invoice.move_type == 'out_invoice' and
-                        invoice.partner_id and
-                        invoice.id in old_residuals):
-
-                    old_residual = old_residuals[invoice.id]
-                    new_residual = invoice.amount_residual
-
-                    if old_residual != new_residual:
-                        credit_lines = self.env['res.partner.credit.line'].search([
-                            ('partner_id', '=', invoice.partner_id.id)
-                        ])
-                        for credit_line in credit_lines:
-                            credit_line.force_refresh_credit()
-
-        return result
-
-
-class AccountPayment(models.Model):
-    _inherit = 'account.payment'
-
-    product_category_id = fields.Many2one(
-        'product.category',
-        string='Product Category',
-        help='Select the product category for this payment',
-        store=True
-    )
-
-    @api.model_create_multi
-    def create(self, vals_list):
-        records = super(AccountPayment, self).create(vals_list)
-        return records
-
-    def action_post(self):
-        """When payment is posted - RESTORE CREDIT IMMEDIATELY"""
-        result = super(AccountPayment, self).action_post()
-
-        for payment in self:
-            if (payment.partner_type == 'customer' and
-                    payment.partner_id and
-                    payment.product_category_id):
-                # SIMPLE: Directly reduce credit used by payment amount
-                self._restore_credit_directly(payment)
-
-        return result
-
-    def _restore_credit_directly(self, payment):
-        """SIMPLE: Directly restore credit when payment is made"""
-        # Find credit line for this customer and category
-        credit_line = self.env['res.partner.credit.line'].search([
-            ('partner_id', '=', payment.partner_id.id),
-            ('product_category_id', '=', payment.product_category_id.id)
-        ], limit=1)
-
-        if credit_line:
-            # Find the corresponding sale order and invoice
-            sale_orders = self.env['sale.order'].search([
-                ('partner_id', '=', payment.partner_id.id),
-                ('product_category_id', '=', payment.product_category_id.id),
-                ('state', 'in', ['sale', 'done'])
-            ])
-
-            for order in sale_orders:
-                # Find invoice for this order
-                invoices = order.invoice_ids.filtered(
-                    lambda inv: inv.move_type == 'out_invoice' and inv.state == 'posted'
-                )
-
-                for invoice in invoices:
-                    if invoice.amount_residual > 0:
-                        # DIRECTLY reduce the invoice amount_residual
-                        payment_amount = min(payment.amount, invoice.amount_residual)
-                        new_residual = invoice.amount_residual - payment_amount
-
-                        # Update invoice residual directly
-                        invoice.write({'amount_residual': new_residual})
-
-                        # Force credit refresh
-                        credit_line._compute_credit_usage()
-
-                        # Force sale order refresh
-                        order._compute_credit_info()
-
-                        break
-
-    def action_cancel(self):
-        """When payment is cancelled - restore the credit usage"""
-        result = super(AccountPayment, self).action_cancel()
-
-        for payment in self:
-            if (payment.partner_type == 'customer' and
-                    payment.partner_id and
-                    payment.product_category_id):
-                # Restore credit usage when payment is cancelled
-                self._restore_credit_on_cancel(payment)
+        # Trigger overdue recalculation when invoice changes
+        if any(field in vals for field in ['state', 'amount_residual', 'payment_state', 'invoice_date_due']):
+            events._add_overdue_partners(self._get_overdue_customers())
 
         return result
 
-    def _restore_credit_on_cancel(self, payment):
-        """Restore credit usage when payment is cancelled"""
-        # Find credit line
-        credit_line = self.env['res.partner.credit.line'].search([
-            ('partner_id', '=', payment.partner_id.id),
-            ('product_category_id', '=', payment.product_category_id.id)
-        ], limit=1)
-
-        if credit_line:
-            # Find sale orders and invoices
-            sale_orders = self.env['sale.order'].search([
-                ('partner_id', '=', payment.partner_id.id),
-                ('product_category_id', '=', payment.product_category_id.id),
-                ('state', 'in', ['sale', 'done'])
-            ])
-
-            for order in sale_orders:
-                invoices = order.invoice_ids.filtered(
-                    lambda inv: inv.move_type == 'out_invoice' and inv.state == 'posted'
-                )
-
-                for invoice in invoices:
-                    # Increase the amount_residual back
-                    new_residual = invoice.amount_residual + payment.amount
-                    invoice.write({'amount_residual': new_residual})
-
-                    # Force refresh
-                    credit_line._compute_credit_usage()
-                    order._compute_credit_info()
-
-                    break
-
 
 class AccountPartialReconcile(models.Model):
     _inherit = 'account.partial.reconcile'
@@ -1314,46 +1556,31 @@ class AccountPartialReconcile(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         """STEP 5: When reconciliation happens - THIS IS THE KEY MOMENT"""
-        records = super(AccountPartialReconcile, self).create(vals_list)
-
-        customers_to_refresh = set()
+        line_ids = set()
+        for vals in vals_list:
+            line_ids.update(filter(None, [vals.get('debit_move_id'), vals.get('credit_move_id')]))
+        moves = self.env['account.move.line'].browse(line_ids).move_id
 
-        for result in records:
-            if result.debit_move_id and result.credit_move_id:
-                for move_line in [result.debit_move_id, result.credit_move_id]:
-                    move = move_line.move_id
-                    if move.move_type == 'out_invoice' and move.partner_id:
-                        customers_to_refresh.add(move.partner_id)
+        events = self.env['res.partner.credit.event']
+        events._track_reconciled_orders(moves._get_credit_orders())
 
-        for partner in customers_to_refresh:
-            credit_lines = self.env['res.partner.credit.line'].search([
-                ('partner_id', '=', partner.id)
-            ])
+        records = super(AccountPartialReconcile, self).create(vals_list)
 
-            for credit_line in credit_lines:
-                credit_line.force_refresh_credit()
+        # Update overdue when payment happens
+        events._add_overdue_partners(moves._get_overdue_customers())
 
         return records
 
     def unlink(self):
         """When reconciliation is undone"""
-        customers_to_refresh = set()
+        moves = (self.debit_move_id | self.credit_move_id).move_id
 
-        for reconcile in self:
-            if reconcile.debit_move_id and reconcile.credit_move_id:
-                for move_line in [reconcile.debit_move_id, reconcile.credit_move_id]:
-                    move = move_line.move_id
-                    if move.move_type == 'out_invoice' and move.partner_id:
-                        customers_to_refresh.add(move.partner_id)
+        events = self.env['res.partner.credit.event']
+        events._track_reconciled_orders(moves._get_credit_orders())
 
         result = super(AccountPartialReconcile, self).unlink()
 
-        for partner in customers_to_refresh:
-            credit_lines = self.env['res.partner.credit.line'].search([
-                ('partner_id', '=', partner.id)
-            ])
-
-            for credit_line in credit_lines:
-                credit_line.force_refresh_credit()
+        # Update overdue when reconciliation is undone
+        events._add_overdue_partners(moves._get_overdue_customers())
 
         return result
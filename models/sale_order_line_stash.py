@@ -0,0 +1,162 @@
+from collections import defaultdict
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_index
+
+
+class SaleOrderLineStash(models.Model):
+    _name = 'sale.order.line.stash'
+    _description = 'Stashed Sale Order Line'
+    _order = 'order_id, product_category_id, sequence, id'
+
+    order_id = fields.Many2one(
+        'sale.order',
+        string='Order',
+        required=True,
+        ondelete='cascade'
+    )
+
+    product_category_id = fields.Many2one(
+        'product.category',
+        string='Category',
+        required=True,
+        ondelete='cascade',
+        help='Category the lines were entered under'
+    )
+
+    sequence = fields.Integer(string='Sequence', default=10)
+
+    product_id = fields.Many2one(
+        'product.product',
+        string='Product',
+        required=True,
+        ondelete='cascade'
+    )
+
+    product_uom_qty = fields.Float(
+        string='Quantity',
+        digits='Product Unit of Measure',
+        default=1.0
+    )
+
+    price_unit = fields.Float(
+        string='Unit Price',
+        digits='Product Price'
+    )
+
+    name = fields.Text(string='Description')
+
+    def init(self):
+        # Lines are always read and written for one (order, category)
+        create_index(
+            self.env.cr,
+            'sale_order_line_stash_order_category_idx',
+            self._table,
+            ['order_id', 'product_category_id', 'sequence'],
+        )
+
+    @api.model
+    def _get_stash_values(self, line):
+        """Stashed columns of a sale order line, or of a stash row"""
+        return {
+            'product_id': line.product_id.id,
+            'product_uom_qty': line.product_uom_qty,
+            'price_unit': line.price_unit,
+            'name': line.name or '',
+        }
+
+    @api.model
+    def _save_lines(self, orders):
+        """Stash the product lines of orders under their current category"""
+        self._write_stash({
+            (order.id, order.product_category_id.id): [
+                self._get_stash_values(line) for line in order.order_line.filtered('product_id')
+            ]
+            for order in orders.filtered('product_category_id')
+        })
+
+    @api.model
+    def _save_snapshot(self, order, snapshot):
+        """Stash the lines an unsaved form kept for the other categories (see _snapshot_lines)"""
+        self._write_stash({
+            (order.id, int(category_id)): lines
+            for category_id, lines in ((snapshot or {}).get('lines') or {}).items()
+            if int(category_id) != order.product_category_id.id
+        })
+
+    @api.model
+    def _write_stash(self, stashes):
+        """Replace the stash of each (order_id, category_id) by a list of line values.
+
+        Only the rows that differ are written: unchanged stashes cost one read.
+        """
+        if not stashes:
+            return
+
+        stashed = defaultdict(lambda: self.browse())
+        for row in self.search([('order_id', 'in', list({order_id for order_id, category_id in stashes}))]):
+            stashed[(row.order_id.id, row.product_category_id.id)] |= row
+
+        to_create = []
+        to_unlink = self.browse()
+        for (order_id, category_id), lines in stashes.items():
+            rows = stashed[(order_id, category_id)]
+            for sequence, values in enumerate(lines):
+                if sequence < len(rows):
+                    row = rows[sequence]
+                    stashed_values = self._get_stash_values(row)
+                    changed = {
+                        fname: value for fname, value in values.items()
+                        if stashed_values[fname] != value
+                    }
+                    if row.sequence != sequence:
+                        changed['sequence'] = sequence
+                    if changed:
+                        row.write(changed)
+                else:
+                    to_create.append(dict(
+                        values,
+                        order_id=order_id,
+                        product_category_id=category_id,
+                        sequence=sequence,
+                    ))
+            to_unlink |= rows[len(lines):]
+
+        to_unlink.unlink()
+        self.create(to_create)
+
+    @api.model
+    def _snapshot_lines(self, order):
+        """Keep the current lines of a form in its line_stash_snapshot before a category switch.
+
+        The snapshot is {'category_id': category of the current lines,
+        'lines': {category_id: [line values]}}; it rides along the onchange
+        values, so switching back and forth in an unsaved form keeps the lines.
+        """
+        snapshot = order.line_stash_snapshot or {}
+        lines = dict(snapshot.get('lines') or {})
+        previous_category_id = snapshot.get('category_id') or order._origin.product_category_id.id
+        if previous_category_id and previous_category_id != order.product_category_id.id:
+            lines[str(previous_category_id)] = [
+                self._get_stash_values(line) for line in order.order_line.filtered('product_id')
+            ]
+        order.line_stash_snapshot = {'category_id': order.product_category_id.id, 'lines': lines}
+
+    @api.model
+    def _get_stashed_lines(self, order, category):
+        """Stashed line values of an order for a category, in line order.
+
+        Lines kept by the form snapshot win over the stored ones.
+        """
+        if not category:
+            return []
+        snapshot_lines = ((order.line_stash_snapshot or {}).get('lines') or {}).get(str(category.id))
+        if snapshot_lines is not None:
+            return [dict(values) for values in snapshot_lines]
+        if not order._origin.id:
+            return []
+        rows = self.search([
+            ('order_id', '=', order._origin.id),
+            ('product_category_id', '=', category.id),
+        ])
+        return [self._get_stash_values(row) for row in rows]
@@ -0,0 +1,2 @@
+from . import test_credit_event
+from . import test_credit_exposure_lock
@@ -0,0 +1,107 @@
+from odoo import Command, fields
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCreditEvent(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.category = cls.env['product.category'].create({'name': 'Fertilizer'})
+        cls.other_category = cls.env['product.category'].create({'name': 'SND'})
+        cls.product_a.write({'categ_id': cls.category.id, 'invoice_policy': 'order'})
+        cls.partner_a.write({
+            'license_number': 'LIC-0001',
+            'license_valid_upto': fields.Date.add(fields.Date.today(), years=1),
+        })
+        cls.env['res.partner.credit.line'].create({
+            'partner_id': cls.partner_a.id,
+            'product_category_id': cls.category.id,
+            'credit_limit': 100000.0,
+        })
+        business_unit_model = cls.env['sale.order']._fields['business_unit'].comodel_name
+        cls.business_unit = cls.env[business_unit_model].create({'name': 'Fertilizer'})
+        cls.events = cls.env['res.partner.credit.event']
+        cls.exposure = cls.env['res.partner.credit.exposure']
+        cls.pair = (cls.partner_a.id, cls.category.id)
+
+    def _create_invoiced_orders(self, count):
+        """Confirm orders of the test pair and post their invoices, with the events applied"""
+        orders = self.env['sale.order'].create([{
+            'partner_id': self.partner_a.id,
+            'business_unit': self.business_unit.id,
+            'product_category_id': self.category.id,
+            'order_line': [Command.create({'product_id': self.product_a.id, 'price_unit': 100.0})],
+        } for _ in range(count)])
+        orders.action_check_credit_limit_batch()
+        orders.action_confirm()
+        invoices = orders._create_invoices()
+        invoices.action_post()
+        self.events._flush_events()
+        return orders, invoices
+
+    def _post_payment(self, amount):
+        """Post a category payment, its credit events stay queued until _flush_events()"""
+        payment = self.env['account.payment'].create({
+            'payment_type': 'inbound',
+            'partner_type': 'customer',
+            'partner_id': self.partner_a.id,
+            'product_category_id': self.category.id,
+            'amount': amount,
+        })
+        payment.action_post()
+        self.env.flush_all()
+        self.env.invalidate_all()
+        return payment
+
+    def _get_ledger(self, pairs):
+        self.exposure.flush_model()
+        return self.exposure._read_exposure(pairs, refresh=False)
+
+    def test_payment_post_updates_ledger_once(self):
+        """A payment settling the invoices of several orders moves the ledger once, in constant queries"""
+        # One order: its dispatch cost is the budget of any number of orders of the same pair
+        _orders, invoices = self._create_invoiced_orders(1)
+        before = self._get_ledger([self.pair])[self.pair]
+        self._post_payment(invoices.amount_total)
+        queries_before = self.cr.sql_log_count
+        self.events._flush_events()
+        single_order_budget = self.cr.sql_log_count - queries_before
+        after = self._get_ledger([self.pair])[self.pair]
+        self.assertAlmostEqual(after[0], before[0] - invoices.amount_total)
+        self.assertEqual(after[1], before[1] + 1)
+
+        # Three orders, three invoices and three reconciliations: still one update of the pair
+        _orders, invoices = self._create_invoiced_orders(3)
+        before = self._get_ledger([self.pair])[self.pair]
+        payment = self._post_payment(sum(invoices.mapped('amount_total')))
+        with self.assertQueryCount(single_order_budget):
+            self.events._flush_events()
+        after = self._get_ledger([self.pair])[self.pair]
+
+        self.assertEqual(len(payment.credit_allocation_ids), 3)
+        self.assertEqual(set(invoices.mapped('payment_state')), {'paid'})
+        self.assertAlmostEqual(after[0], before[0] - sum(invoices.mapped('amount_total')))
+        self.assertEqual(after[1], before[1] + 1, "the payment's deltas reach the ledger in one update")
+
+    def test_flush_events_applies_each_pair_once(self):
+        """Deltas queued many times for a (partner, category) reach the ledger in one update"""
+        pair = (self.partner_a.id, self.category.id)
+        other_pair = (self.partner_a.id, self.other_category.id)
+        self.exposure._apply_deltas({pair: 1000.0, other_pair: 500.0})
+        before = self._get_ledger([pair, other_pair])
+
+        self.events._add_deltas({pair: 100.0})
+        self.events._add_deltas({pair: 50.0, other_pair: -200.0})
+        self.events._add_deltas({pair: -30.0})
+        self.events._flush_events()
+
+        after = self._get_ledger([pair, other_pair])
+        self.assertEqual(after[pair], (before[pair][0] + 120.0, before[pair][1] + 1))
+        self.assertEqual(after[other_pair], (before[other_pair][0] - 200.0, before[other_pair][1] + 1))
+
+        # The queue is consumed: flushing again changes nothing
+        self.events._flush_events()
+        self.assertEqual(self._get_ledger([pair, other_pair]), after)
@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from psycopg2 import errors
+
+from odoo import api, fields, Command, SUPERUSER_ID
+from odoo.modules.registry import Registry
+from odoo.tests.common import BaseCase, get_db_name, tagged
+from odoo.tools import mute_logger
+
+_logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT_PARAM = 'customer_credit.lock_timeout_ms'
+
+
+class CreditExposureCursorCase(BaseCase):
+    """Real transactions side by side: every fixture is committed, and removed on cleanup"""
+
+    @contextmanager
+    def environment(self):
+        with Registry(get_db_name()).cursor() as cr:
+            yield api.Environment(cr, SUPERUSER_ID, {})
+
+    def _set_lock_timeout(self, timeout_ms):
+        """Commit the lock timeout every transaction of the test reads"""
+        with self.environment() as env:
+            previous = env['ir.config_parameter'].get_param(LOCK_TIMEOUT_PARAM)
+            env['ir.config_parameter'].set_param(LOCK_TIMEOUT_PARAM, timeout_ms)
+        self.addCleanup(self._restore_lock_timeout, previous)
+
+    def _restore_lock_timeout(self, previous):
+        with self.environment() as env:
+            env['ir.config_parameter'].set_param(LOCK_TIMEOUT_PARAM, previous)
+
+
+@tagged('post_install', '-at_install')
+class TestCreditExposureLock(CreditExposureCursorCase):
+    """Two real transactions confirming against the same credit exposure"""
+
+    def setUp(self):
+        super().setUp()
+        self._set_lock_timeout(100)
+        # The other transaction only sees committed data
+        with self.environment() as env:
+            self.partner_id = env['res.partner'].create({'name': 'Credit Lock Customer'}).id
+            self.category_id = env['product.category'].create({'name': 'Credit Lock Category'}).id
+            env['res.partner.credit.exposure']._apply_deltas({(self.partner_id, self.category_id): 1000.0})
+        self.addCleanup(self._cleanup)
+
+    def _cleanup(self):
+        with self.environment() as env:
+            env['res.partner'].browse(self.partner_id).unlink()
+            env['product.category'].browse(self.category_id).unlink()
+
+    def test_second_confirmer_waits_then_sees_new_exposure(self):
+        pair = (self.partner_id, self.category_id)
+        with self.environment() as env1, self.environment() as env2:
+            # First confirmer locks the row and consumes credit
+            env1['res.partner.credit.exposure']._lock_exposure([pair])
+            env1['res.partner.credit.exposure']._apply_deltas({pair: 250.0})
+
+            # Second confirmer gives up after its lock timeout, not after the default wait
+            started = time.monotonic()
+            with mute_logger('odoo.sql_db', 'odoo.addons.customer_credit.models.credit_exposure'):
+                with self.assertRaises(errors.LockNotAvailable):
+                    env2['res.partner.credit.exposure']._lock_exposure([pair])
+            self.assertLess(time.monotonic() - started, 1.0)
+            env2.cr.rollback()
+            env2.invalidate_all()
+
+            env1.cr.commit()
+
+            # Retried, it gets the lock and reads the exposure left by the first one
+            env2['res.partner.credit.exposure']._lock_exposure([pair])
+            self.assertEqual(env2['res.partner.credit.exposure']._get_exposure([pair])[pair], 1250.0)
+
+
+@tagged('post_install', '-at_install', '-standard', 'credit_load')
+class TestCreditExposureConcurrentConfirm(CreditExposureCursorCase):
+    """Load harness: concurrent confirmers of one customer and category through action_confirm.
+
+    Not part of the standard run, select it with --test-tags credit_load.
+    Logs the throughput, the lock timeouts retried and the slowest confirmation.
+    """
+
+    CONFIRMERS = 16
+    ORDERS_PER_CONFIRMER = 5
+    MAX_ATTEMPTS = 20
+
+    def setUp(self):
+        super().setUp()
+        with self.environment() as env:
+            partner = env['res.partner'].create({
+                'name': 'Credit Load Customer',
+                'customer_rank': 1,
+                'license_number': 'LOAD-0001',
+                'license_valid_upto': fields.Date.add(fields.Date.today(), years=1),
+            })
+            category = env['product.category'].create({'name': 'Credit Load Category'})
+            product = env['product.product'].create({
+                'name': 'Credit Load Product',
+                'categ_id': category.id,
+                'list_price': 100.0,
+                'taxes_id': [Command.clear()],
+            })
+            self.business_unit_model = env['sale.order']._fields['business_unit'].comodel_name
+            business_unit = env[self.business_unit_model].create({'name': 'Credit Load Fertilizer'})
+            env['res.partner.credit.line'].create({
+                'partner_id': partner.id,
+                'product_category_id': category.id,
+                'credit_limit': 1e9,
+            })
+            orders = env['sale.order'].create([{
+                'partner_id': partner.id,
+                'business_unit': business_unit.id,
+                'product_category_id': category.id,
+                'order_line': [Command.create({'product_id': product.id, 'price_unit': 100.0})],
+            } for _ in range(self.CONFIRMERS * self.ORDERS_PER_CONFIRMER)])
+            orders.action_check_credit_limit_batch()
+
+            self.partner_id = partner.id
+            self.category_id = category.id
+            self.product_id = product.id
+            self.business_unit_id = business_unit.id
+            self.order_ids = orders.ids
+            self.expected_exposure = sum(orders.mapped('amount_total'))
+        self.addCleanup(self._cleanup)
+
+    def _cleanup(self):
+        with self.environment() as env:
+            # Confirmed orders cannot be unlinked through the ORM
+            env.cr.execute("DELETE FROM sale_order WHERE id = ANY(%s)", [self.order_ids])
+            env.invalidate_all()
+            env['product.product'].browse(self.product_id).product_tmpl_id.unlink()
+            env[self.business_unit_model].browse(self.business_unit_id).unlink()
+            env['res.partner'].browse(self.partner_id).unlink()
+            env['product.category'].browse(self.category_id).unlink()
+
+    def _confirm_orders(self, order_ids, stats, failures):
+        """Confirm each order in its own transaction, retrying lock timeouts"""
+        try:
+            for order_id in order_ids:
+                for _attempt in range(self.MAX_ATTEMPTS):
+                    started = time.monotonic()
+                    try:
+                        with self.environment() as env:
+                            env['sale.order'].browse(order_id).action_confirm()
+                    except (errors.LockNotAvailable, errors.SerializationFailure):
+                        stats['retries'] += 1
+                        stats['wait'] += time.monotonic() - started
+                        continue
+                    stats['confirmed'] += 1
+                    stats['slowest'] = max(stats['slowest'], time.monotonic() - started)
+                    break
+        except Exception as e:
+            failures.append(e)
+
+    def test_concurrent_confirmers(self):
+        batches = [
+            self.order_ids[index::self.CONFIRMERS]
+            for index in range(self.CONFIRMERS)
+        ]
+        stats = [{'confirmed': 0, 'retries': 0, 'wait': 0.0, 'slowest': 0.0} for _ in batches]
+        failures = []
+        threads = [
+            threading.Thread(target=self._confirm_orders, args=(batch, batch_stats, failures))
+            for batch, batch_stats in zip(batches, stats)
+        ]
+
+        started = time.monotonic()
+        with mute_logger('odoo.sql_db', 'odoo.addons.customer_credit.models.credit_exposure'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.monotonic() - started
+
+        if failures:
+            raise failures[0]
+        confirmed = sum(batch_stats['confirmed'] for batch_stats in stats)
+        retries = sum(batch_stats['retries'] for batch_stats in stats)
+        _logger.info(
+            "%s orders confirmed by %s confirmers in %.2fs (%.1f orders/s), "
+            "%s lock timeouts retried after %.2fs of waits, slowest confirmation %.0fms",
+            confirmed, self.CONFIRMERS, elapsed, confirmed / elapsed,
+            retries, sum(batch_stats['wait'] for batch_stats in stats),
+            max(batch_stats['slowest'] for batch_stats in stats) * 1000,
+        )
+
+        # Every order went through, and the ledger counts each of them exactly once
+        self.assertEqual(confirmed, len(self.order_ids))
+        with self.environment() as env:
+            orders = env['sale.order'].browse(self.order_ids)
+            self.assertEqual(set(orders.mapped('state')), {'sale'})
+            pair = (self.partner_id, self.category_id)
+            exposure = env['res.partner.credit.exposure']._get_exposure([pair])
+            self.assertAlmostEqual(exposure[pair], self.expected_exposure, places=2)
@@ -0,0 +1,2 @@
+from . import credit_limit_import
+from . import account_payment_register
@@ -0,0 +1,27 @@
+from odoo import models, api
+
+
+class AccountPaymentRegister(models.TransientModel):
+    _inherit = 'account.payment.register'
+
+    @api.model
+    def _get_line_batch_key(self, line):
+        """One payment per product category: invoices of different categories never share a batch"""
+        batch_key = super(AccountPaymentRegister, self)._get_line_batch_key(line)
+        batch_key['product_category_id'] = line.move_id.product_category_id.id
+        return batch_key
+
+    def _create_payment_vals_from_wizard(self, batch_result):
+        payment_vals = super(AccountPaymentRegister, self)._create_payment_vals_from_wizard(batch_result)
+        payment_vals['product_category_id'] = batch_result['payment_values'].get('product_category_id')
+        return payment_vals
+
+    def _create_payment_vals_from_batch(self, batch_result):
+        payment_vals = super(AccountPaymentRegister, self)._create_payment_vals_from_batch(batch_result)
+        payment_vals['product_category_id'] = batch_result['payment_values'].get('product_category_id')
+        return payment_vals
+
+    def _create_payments(self):
+        # The wizard reconciles each payment with the invoices that were selected,
+        # the oldest-first allocation of account.payment must not take them first
+        return super(AccountPaymentRegister, self.with_context(skip_credit_allocation=True))._create_payments()
@@ -0,0 +1,209 @@
+import base64
+import csv
+import io
+import logging
+
+from odoo import models, fields, api, modules
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+IMPORT_COLUMNS = ['partner_ref', 'category', 'credit_limit', 'is_infinite_credit']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'x'}
+FALSE_VALUES = {'', '0', 'false', 'no', 'n'}
+
+
+class CreditLimitImport(models.TransientModel):
+    _name = 'credit.limit.import'
+    _description = 'Import Customer Credit Limits'
+
+    file = fields.Binary(
+        string='CSV File',
+        required=True,
+        help='Columns: partner_ref, category, credit_limit, is_infinite_credit'
+    )
+
+    filename = fields.Char(string='File Name')
+
+    chunk_size = fields.Integer(
+        string='Rows per Batch',
+        default=5000,
+        help='Rows validated and written together'
+    )
+
+    commit_chunks = fields.Boolean(
+        string='Commit Each Batch',
+        default=True,
+        help='Commit after every batch so a failure does not lose the rows already imported'
+    )
+
+    state = fields.Selection([
+        ('draft', 'Upload'),
+        ('done', 'Done'),
+    ], default='draft')
+
+    imported_count = fields.Integer(string='Imported Rows', readonly=True)
+
+    error_count = fields.Integer(string='Rejected Rows', readonly=True)
+
+    error_file = fields.Binary(string='Error Report', readonly=True)
+
+    error_filename = fields.Char(string='Error Report Name', readonly=True)
+
+    def action_import(self):
+        """Stream the CSV and upsert credit lines batch by batch"""
+        self.ensure_one()
+        if self.chunk_size <= 0:
+            raise UserError("Rows per batch must be positive.")
+
+        stream = io.TextIOWrapper(io.BytesIO(base64.b64decode(self.file)), encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(stream)
+        missing_columns = [column for column in IMPORT_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing_columns:
+            raise UserError(f"Missing columns in the CSV file: {', '.join(missing_columns)}")
+
+        imported_count = 0
+        errors = []
+        row_number = 1
+        for chunk in split_every(self.chunk_size, reader):
+            rows = []
+            for row in chunk:
+                row_number += 1
+                rows.append((row_number, row))
+
+            imported, chunk_errors = self._import_chunk(rows)
+            imported_count += imported
+            errors += chunk_errors
+
+            if self.commit_chunks and not modules.module.current_test:
+                self.env.cr.commit()
+            _logger.info("Credit limit import: %s rows imported, %s rejected", imported_count, len(errors))
+
+        vals = {
+            'state': 'done',
+            'imported_count': imported_count,
+            'error_count': len(errors),
+            'error_file': False,
+            'error_filename': False,
+        }
+        if errors:
+            vals['error_file'] = base64.b64encode(self._build_error_report(errors))
+            vals['error_filename'] = 'credit_limit_import_errors.csv'
+        self.write(vals)
+
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _import_chunk(self, rows):
+        """Validate one batch of (row_number, row) and upsert it, returns (imported, errors)"""
+        # Resolve every partner and category of the batch with one lookup each
+        refs = {row['partner_ref'].strip() for row_number, row in rows if row['partner_ref']}
+        categories = {row['category'].strip() for row_number, row in rows if row['category']}
+        partner_ids = self._resolve_partners(refs)
+        category_ids = self._resolve_categories(categories)
+
+        errors = []
+        values = {}
+        for row_number, row in rows:
+            partner_ref = (row['partner_ref'] or '').strip()
+            category = (row['category'] or '').strip()
+            infinite_value = (row['is_infinite_credit'] or '').strip().lower()
+            try:
+                if partner_ids.get(partner_ref) is None:
+                    raise ValueError(f"Unknown customer reference '{partner_ref}'")
+                if partner_ids[partner_ref] is False:
+                    raise ValueError(f"Customer reference '{partner_ref}' is used by several customers")
+                if category_ids.get(category) is None:
+                    raise ValueError(f"Unknown category '{category}'")
+                if category_ids[category] is False:
+                    raise ValueError(f"Category '{category}' matches several categories")
+                if infinite_value not in TRUE_VALUES | FALSE_VALUES:
+                    raise ValueError(f"Invalid infinite credit flag '{row['is_infinite_credit']}'")
+
+                is_infinite_credit = infinite_value in TRUE_VALUES
+                credit_limit = 0.0
+                if not is_infinite_credit:
+                    credit_limit = float((row['credit_limit'] or '0').replace(',', ''))
+                    if credit_limit < 0:
+                        raise ValueError("Credit limit cannot be negative.")
+            except ValueError as error:
+                errors.append((row_number, row, str(error)))
+                continue
+
+            # The last row wins when a pair appears twice in the batch
+            values[(partner_ids[partner_ref], category_ids[category])] = (credit_limit, is_infinite_credit)
+
+        if values:
+            self._upsert_credit_lines(values)
+        return len(values), errors
+
+    def _resolve_partners(self, refs):
+        """Return {ref: partner_id}, False when the reference is ambiguous"""
+        partner_ids = {}
+        for partner in self.env['res.partner'].search_read([('ref', 'in', list(refs))], ['ref']):
+            partner_ids[partner['ref']] = False if partner['ref'] in partner_ids else partner['id']
+        return partner_ids
+
+    def _resolve_categories(self, names):
+        """Return {name or complete name: category_id}, False when ambiguous"""
+        category_ids = {}
+        categories = self.env['product.category'].search_read(
+            ['|', ('complete_name', 'in', list(names)), ('name', 'in', list(names))],
+            ['name', 'complete_name']
+        )
+        for category in categories:
+            for key in {category['name'], category['complete_name']} & names:
+                category_ids[key] = False if key in category_ids else category['id']
+        return category_ids
+
+    def _upsert_credit_lines(self, values):
+        """Insert or update credit lines {(partner_id, category_id): (limit, infinite)} in one query"""
+        credit_line = self.env['res.partner.credit.line']
+        credit_line.flush_model()
+        pairs = list(values)
+        self.env.cr.execute("""
+            INSERT INTO res_partner_credit_line
+                   (partner_id, product_category_id, credit_limit, is_infinite_credit,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT v.partner_id, v.category_id, v.credit_limit, v.is_infinite_credit,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM unnest(%(partners)s::int[], %(categories)s::int[],
+                          %(limits)s::float8[], %(infinite)s::bool[])
+                   AS v(partner_id, category_id, credit_limit, is_infinite_credit)
+            ON CONFLICT (partner_id, product_category_id) DO UPDATE
+               SET credit_limit = EXCLUDED.credit_limit,
+                   is_infinite_credit = EXCLUDED.is_infinite_credit,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+         RETURNING id
+        """, {
+            'uid': self.env.uid,
+            'partners': [partner_id for partner_id, category_id in pairs],
+            'categories': [category_id for partner_id, category_id in pairs],
+            'limits': [values[pair][0] for pair in pairs],
+            'infinite': [values[pair][1] for pair in pairs],
+        })
+
+        line_ids = [row[0] for row in self.env.cr.fetchall()]
+
+        # Same invalidations as the ORM create/write of credit lines
+        credit_line.invalidate_model()
+        self.env.registry.clear_cache()
+        self.env['res.partner.credit.exposure']._bump_versions(pairs)
+        credit_line.browse(line_ids)._recompute_quotations()
+
+    @api.model
+    def _build_error_report(self, errors):
+        """CSV of the rejected rows with the reason in front"""
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['row', 'error'] + IMPORT_COLUMNS)
+        for row_number, row, error in errors:
+            writer.writerow([row_number, error] + [row.get(column) or '' for column in IMPORT_COLUMNS])
+        return output.getvalue().encode('utf-8')